@@ -1,8 +1,20 @@
 #!/usr/bin/env python3
 
-import json
-from flask import Flask, render_template_string
-from occupant_service import get_leases_data
+import hashlib
+from flask import Flask, Response, jsonify, render_template, request
+from booth_events import BoothEventHub, parse_event_id
+from booth_view import BoothViewCache
+from buildium_api import BuildiumError, rate_limiter_metrics
+from map_layout import get_layout
+from occupant_service import (
+    MAP_PROPERTY_NAME,
+    last_fetch_timings,
+    last_match_stats,
+    occupant_cache,
+    resource_status,
+)
+from response_compression import compressed_bodies, finish_response
+from snapshot_share import SNAPSHOT_MODE, SharedSnapshotReader, SnapshotNotReady, SnapshotRefresher
 
 app = Flask(__name__)
 
@@ -16,143 +28,7 @@ app.jinja_options = {
     'comment_end_string': '#)'
 }
 
-def parse_token(token):
-    """
-    If token starts with 'S' or 'P', strip that letter => numeric booth label.
-      e.g. 'S24' => prefix 'S', booth '24'
-           'P10' => prefix 'P', booth '10'
-    If token starts with 'K' or 'OF', keep entire token => lettered booth
-      e.g. 'K1' => prefix 'K', booth 'K1'
-           'OF2' => prefix 'OF', booth 'OF2'
-    Otherwise => no prefix => raw token as booth label.
-    """
-    up = token.upper().strip()
-    if up.startswith("S"):
-        return ("S", up[1:])
-    if up.startswith("P"):
-        return ("P", up[1:])
-    if up.startswith("K"):
-        return ("K", up)  # e.g. 'K3'
-    if up.startswith("OF"):
-        return ("OF", up) # e.g. 'OF2'
-    return ("", up)
-
-def occupantColor(occupant_list):
-    """
-    Slightly darker pastel color logic:
-      1) If total_bal > 0 => Past Due => #ff8a8a
-      2) If occupant_name has 'company storage' => #bca4ff
-      3) Else prefix-based:
-         S => #a7aae6        (Storage)
-         P => #84c7ff        (Pantry)
-         K => #72f0d5        (Kitchen)
-         OF => #ffca7a       (Office)
-      4) Else => #8ae89f     (On Time)
-    """
-    total_bal = sum(o["balance"] for o in occupant_list)
-    if total_bal > 0:
-        return "#ff8a8a"  # Past due
-
-    has_company_storage = any("company storage" in o["occupant_name"].lower()
-                              for o in occupant_list)
-    if has_company_storage:
-        return "#bca4ff"  # Company Storage => pastel purple
-
-    # Check prefix
-    prefix_set = set()
-    for occ in occupant_list:
-        loc_str = occ.get("location","").strip()
-        for t in loc_str.split():
-            pfx, _ = parse_token(t)
-            if pfx:
-                prefix_set.add(pfx)
-
-    # Priority S->P->K->OF
-    if "S" in prefix_set:
-        return "#a7aae6"
-    if "P" in prefix_set:
-        return "#84c7ff"
-    if "K" in prefix_set:
-        return "#72f0d5"
-    if "OF" in prefix_set:
-        return "#ffca7a"
-
-    # Otherwise => On Time
-    return "#8ae89f"
-
-@app.route("/")
-def index():
-    # 1) occupant data
-    all_data = get_leases_data()
-    filtered = [r for r in all_data if r["property_name"] == "Visitors Flea Market"]
-    print("\n=== VFM occupant data (map only) ===")
-    for row in filtered:
-        print(row)
-
-    # 2) load map_layout.json
-    try:
-        with open("map_layout.json", "r") as f:
-            map_data = json.load(f)
-    except:
-        map_data = None
-
-    planeW = 600
-    planeH = 1000
-    booths = []
-    if map_data:
-        planeW = map_data.get("planeWidth", 600)
-        planeH = map_data.get("planeHeight", 1000)
-        booths = map_data.get("booths", [])
-
-    # occupant_map => { booth_label.upper().strip(): [ occupantData, ... ] }
-    occupant_map = {}
-    for row in filtered:
-        occupant_name = row["occupant_name"]
-        loc_str       = (row["location"] or "").strip()
-        bal           = row["balance"]
-        lease_id      = row["lease_id"]
-        end_date      = row["lease_end_date"]
-
-        if loc_str and loc_str != "N/A":
-            for t in loc_str.split():
-                pfx, booth_lbl = parse_token(t)
-                # Force uppercase & strip
-                booth_key = booth_lbl.upper().strip()
-                occupant_map.setdefault(booth_key, []).append({
-                    "occupant_name": occupant_name,
-                    "lease_id": lease_id,
-                    "lease_end": end_date,
-                    "balance": bal,
-                    "location": loc_str
-                })
-
-    # 3) color-code each booth
-    for b in booths:
-        original_label = (b.get("label","").strip())
-        label_up       = original_label.upper().strip()
-
-        occupant_list  = occupant_map.get(label_up, [])
-        if occupant_list:
-            b["occupants"] = occupant_list
-            b["color"]     = occupantColor(occupant_list)
-        else:
-            b["occupants"] = []
-            b["color"]     = "#bdbdbd"  # vacant pastel gray
-
-    # -------------------
-    # ADD: Occupancy & Rent Collection
-    # -------------------
-    total_spots = len(booths)
-    occupied_spots = sum(1 for b in booths if len(b["occupants"]) > 0)
-    occupancy_pct = round((occupied_spots / total_spots * 100), 1) if total_spots else 0
-
-    occupant_count = sum(len(b["occupants"]) for b in booths)
-    occupant_on_time = sum(len([occ for occ in b["occupants"] if occ["balance"] <= 0]) for b in booths)
-    rent_collection_pct = round((occupant_on_time / occupant_count * 100), 1) if occupant_count else 0
-    # -------------------
-
-    # 4) Final HTML
-    html_template = """
+MAP_TEMPLATE = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -244,6 +120,16 @@ def index():
     button.rotate-btn {
       background: #007bff; /* blue */
     }
+    .legend-stat {
+      margin-left: 4px;
+      font-size: 12px;
+      color: #555;
+    }
+    .data-notice {
+      text-align: center;
+      color: #8a5a00;
+      margin: 0 20px 10px;
+    }
     .map-controls {
       display: flex;
       justify-content: center;
@@ -254,9 +140,9 @@ def index():
 </head>
 <body>
   <h1>Visitors Flea Market Rent Collection Map</h1>
+  <p class="data-notice" id="dataNotice" style="display:none;"></p>
 
-  (% if booths|length > 0 %)
-    <div class="pageContent">
+    <div class="pageContent" id="pageContent">
       <div class="map-controls">
         <a href="https://wftmap-c2a97a915c23.herokuapp.com/">
           <button>World Food Trucks</button>
@@ -264,22 +150,26 @@ def index():
         <button class="rotate-btn" onclick="toggleRotation()">Rotate Map</button>
       </div>
       <div id="mapWrapper">
-        <div id="mapContainer" style="width:__PW__px; height:__PH__px;"></div>
+        <div id="mapContainer"></div>
       </div>
     </div>
 
     <div class="legend">
+      <div class="legend-item" onclick="alert('Storage - Booths leased as storage space.')">
+        <div class="color-box" style="background:#a7aae6;"></div>
+        <span>Storage<span class="legend-stat" id="legendStatStorage"></span></span>
+      </div>
       <div class="legend-item" onclick="alert('Pantry - Space rented by food truck vendors for dry, cold, wet storage. Some have walk in freezers, coolers. Some have offices.')">
         <div class="color-box" style="background:#84c7ff;"></div>
-        <span>Pantry</span>
+        <span>Pantry<span class="legend-stat" id="legendStatPantry"></span></span>
       </div>
       <div class="legend-item" onclick="alert('Office Space - Real built out offices near main management offices')">
         <div class="color-box" style="background:#ffca7a;"></div>
-        <span>Office</span>
+        <span>Office<span class="legend-stat" id="legendStatOffice"></span></span>
       </div>
       <div class="legend-item" onclick="alert('Kitchen - Areas used by food operators to prepare or store food.')">
         <div class="color-box" style="background:#72f0d5;"></div>
-        <span>Kitchen</span>
+        <span>Kitchen<span class="legend-stat" id="legendStatKitchen"></span></span>
       </div>
       <div class="legend-item" onclick="alert('Vacant - This booth is currently unoccupied or empty.')">
         <div class="color-box" style="background:#bdbdbd;"></div>
@@ -299,23 +189,197 @@ def index():
       </div>
       <!-- ADDED: Occupancy & Rent Collection side by side -->
       <div class="legend-item legend-info">
-        <span>Occupancy: (( occupancy_pct ))%</span>
-        <span>Rent Collection: (( rent_collection_pct ))%</span>
+        <span>Occupancy: <span id="occupancyPct">--</span>%</span>
+        <span>Rent Collection: <span id="rentCollectionPct">--</span>%</span>
+        <span>Booths:<span class="legend-stat" id="legendStatBooth"></span></span>
+        <span>Outstanding: $<span id="outstandingTotal">--</span></span>
       </div>
     </div>
 
     <script>
     let isRotated = false;
-    let planeWidth  = __PW__;
-    let planeHeight = __PH__;
+    let planeWidth  = 0;
+    let planeHeight = 0;
+
+    // Which /api/booths version this page shows, for /api/booths/changes
+    let mapVersion = null;
+    let mapEpoch = null;
+    let boothDivs = {};
+    let pollTimer = null;
+    const POLL_MS = 30000;
+
+    // ?renderer=canvas draws every booth onto one <canvas> instead of a div per booth
+    const renderer = new URLSearchParams(window.location.search).get("renderer") === "canvas" ? "canvas" : "dom";
+    let canvas = null;
+    let canvasBooths = [];
+    let canvasByLabel = {};
+    let canvasView = null;  // { scale, cssWidth } of the last draw, for hit-testing
+    let drawPending = false;
+
+    function showMessage(text) {
+      clearInterval(pollTimer);
+      if (events) events.close();
+      const page = document.getElementById("pageContent");
+      page.innerHTML = "";
+      const p = document.createElement("p");
+      p.style.margin = "20px";
+      p.textContent = text;
+      page.appendChild(p);
+    }
+
+    let events = null;
 
     function initMap() {
+      loadBooths();
+      if (!window.EventSource) {
+        pollTimer = setInterval(pollChanges, POLL_MS);
+      }
+    }
+
+    // Live updates: the server pushes the same diffs /api/booths/changes returns
+    function subscribe() {
+      if (events || pollTimer !== null || !window.EventSource) return;
+      events = new EventSource("/api/booths/events?since=" + mapVersion + "&epoch=" + encodeURIComponent(mapEpoch));
+      events.addEventListener("changes", e => applyDiff(JSON.parse(e.data)));
+      events.onerror = err => {
+        // readyState 2 (CLOSED): refused (503, server at its stream limit), so poll instead
+        if (events && events.readyState === 2) {
+          events = null;
+          pollTimer = setInterval(pollChanges, POLL_MS);
+        }
+      };
+    }
+
+    function loadBooths() {
+      fetch("/api/booths?format=compact")
+        .then(r => r.json().then(payload => ({ ok: r.ok, payload: payload })))
+        .then(res => {
+          if (!res.ok) {
+            showMessage(res.payload.error || "Could not load booth data.");
+          } else {
+            renderMap(res.payload);
+          }
+        })
+        .catch(err => showMessage("Could not load booth data."));
+    }
+
+    function pollChanges() {
+      if (document.hidden || mapVersion === null) return;
+      fetch("/api/booths/changes?since=" + mapVersion + "&epoch=" + encodeURIComponent(mapEpoch))
+        .then(r => r.ok ? r.json() : null)
+        .then(diff => {
+          if (diff) applyDiff(diff);
+        })
+        .catch(err => {});  // try again next tick
+    }
+
+    function applyDiff(diff) {
+      if (diff.full) {
+        loadBooths();
+        return;
+      }
+      diff.booths.forEach(b => {
+        if (renderer === "canvas") {
+          const booth = canvasByLabel[b.label];
+          if (booth) booth.color = b.color;
+        } else {
+          const div = boothDivs[b.label];
+          if (div) setBoothInfo(div, b);
+        }
+      });
+      if (renderer === "canvas") scheduleDraw();
+      applyFigures(diff);
+      mapVersion = diff.version;
+      mapEpoch = diff.epoch;
+    }
+
+    function applyFigures(payload) {
+      const notice = document.getElementById("dataNotice");
+      notice.textContent = payload.data_notice || "";
+      notice.style.display = payload.data_notice ? "block" : "none";
+      document.getElementById("occupancyPct").textContent = payload.occupancy_pct;
+      document.getElementById("rentCollectionPct").textContent = payload.rent_collection_pct;
+      if (payload.outstanding !== undefined) {
+        document.getElementById("outstandingTotal").textContent = payload.outstanding.toFixed(2);
+      }
+      // Per lease use (what the colours mean): booths leased that way, % paid up
+      const uses = payload.lease_uses || {};
+      Object.keys(uses).forEach(name => {
+        const u = uses[name];
+        const el = document.getElementById("legendStat" + name);
+        if (el) el.textContent = " " + u.booths + " leased, " + u.rent_collection_pct + "% paid";
+      });
+    }
+
+    function setBoothInfo(div, b) {
+      div.style.backgroundColor = b.color || "#bdbdbd";
+      div.onclick = () => showBoothDetails(b.label);
+    }
+
+    function showBoothDetails(boothLabel) {
+      fetch("/api/booths/" + encodeURIComponent(boothLabel))
+        .then(r => r.ok ? r.json() : Promise.reject(r.status))
+        .then(detail => {
+          let occList = detail.occupants || [];
+          if (occList.length > 0) {
+            let info = occList.map(o => {
+              return (
+                "LeaseID: " + o.lease_id + "\\n" +
+                "Occupant: " + o.occupant_name + "\\n" +
+                "End: " + o.lease_end + "\\n" +
+                "Balance: $" + o.balance.toFixed(2)
+              );
+            }).join("\\n----\\n");
+            alert("Booth " + detail.label + "\\n" + info);
+          } else {
+            alert("Booth " + detail.label + "\\nVacant");
+          }
+        })
+        .catch(err => alert("Booth " + boothLabel + "\\nCould not load details."));
+    }
+
+    // format=compact sends columns (label/x/y/w/h + palette indices); expand to booth objects
+    function decodeBooths(booths) {
+      if (Array.isArray(booths)) return booths;
+      const out = new Array(booths.label.length);
+      for (let i = 0; i < out.length; i++) {
+        out[i] = {
+          label: booths.label[i],
+          x: booths.x[i],
+          y: booths.y[i],
+          width: booths.w[i],
+          height: booths.h[i],
+          color: booths.palette[booths.color[i]]
+        };
+      }
+      return out;
+    }
+
+    function renderMap(payload) {
+      mapVersion = payload.version;
+      mapEpoch = payload.epoch;
+      applyFigures(payload);
+
+      const data = decodeBooths(payload.booths);
+      if (data.length === 0) {
+        showMessage("No map_layout.json or no booths found.");
+        return;
+      }
+
+      planeWidth  = payload.plane_width;
+      planeHeight = payload.plane_height;
+      if (renderer === "canvas") {
+        renderCanvas(data);
+        subscribe();
+        return;
+      }
       const ctn = document.getElementById("mapContainer");
 
       ctn.style.width  = planeWidth + "px";
       ctn.style.height = planeHeight + "px";
+      ctn.innerHTML = "";
+      boothDivs = {};
 
-      const data = __BOOTH_JSON__;
       data.forEach(b => {
         const div = document.createElement("div");
         div.className = "booth";
@@ -323,7 +387,6 @@ def index():
         div.style.top    = b.y + "px";
         div.style.width  = b.width + "px";
         div.style.height = b.height + "px";
-        div.style.backgroundColor = b.color || "#bdbdbd";
 
         // Create label span so we can counter-rotate it
         const label = document.createElement("span");
@@ -331,32 +394,117 @@ def index():
         label.textContent = b.label;
         div.appendChild(label);
 
-        let occList = b.occupants || [];
-        if (occList.length > 0) {
-          let info = occList.map(o => {
-            return (
-              "LeaseID: " + o.lease_id + "\\n" +
-              "Occupant: " + o.occupant_name + "\\n" +
-              "End: " + o.lease_end + "\\n" +
-              "Balance: $" + o.balance.toFixed(2)
-            );
-          }).join("\\n----\\n");
-          div.onclick = () => {
-            alert("Booth " + b.label + "\\n" + info);
-          }
-        } else {
-          div.onclick = () => {
-            alert("Booth " + b.label + "\\nVacant");
-          }
-        }
-
+        setBoothInfo(div, b);
+        boothDivs[b.label] = div;
         ctn.appendChild(div);
       });
 
       applyScaling();
+      subscribe();
+    }
+
+    function renderCanvas(data) {
+      canvasBooths = data;
+      canvasByLabel = {};
+      data.forEach(b => { canvasByLabel[b.label] = b; });
+
+      const ctn = document.getElementById("mapContainer");
+      ctn.innerHTML = "";
+      canvas = document.createElement("canvas");
+      canvas.style.display = "block";
+      canvas.style.cursor = "pointer";
+      canvas.onclick = onCanvasClick;
+      ctn.appendChild(canvas);
+      applyScaling();
+    }
+
+    function scheduleDraw() {
+      if (drawPending) return;
+      drawPending = true;
+      requestAnimationFrame(ts => {
+        drawPending = false;
+        drawCanvas();
+      });
+    }
+
+    // Rotation is one transform on the drawing context; labels are drawn upright
+    function drawCanvas() {
+      const wrapper = document.getElementById("mapWrapper");
+      const ctn = document.getElementById("mapContainer");
+      const availableWidth = document.querySelector(".pageContent").clientWidth;
+      const scale = isRotated ? availableWidth / planeHeight : Math.min(1, availableWidth / planeWidth);
+      const cssWidth  = (isRotated ? planeHeight : planeWidth) * scale;
+      const cssHeight = (isRotated ? planeWidth : planeHeight) * scale;
+
+      wrapper.style.width = cssWidth + "px";
+      wrapper.style.height = cssHeight + "px";
+      wrapper.style.position = "relative";
+      ctn.style.position = "relative";
+      ctn.style.left = "0";
+      ctn.style.top = "0";
+      ctn.style.transform = "none";
+      ctn.style.width = cssWidth + "px";
+      ctn.style.height = cssHeight + "px";
+
+      const dpr = window.devicePixelRatio || 1;
+      canvas.width = Math.round(cssWidth * dpr);
+      canvas.height = Math.round(cssHeight * dpr);
+      canvas.style.width = cssWidth + "px";
+      canvas.style.height = cssHeight + "px";
+
+      const ctx = canvas.getContext("2d");
+      ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+      ctx.clearRect(0, 0, cssWidth, cssHeight);
+      if (isRotated) {
+        // 90deg clockwise: plane (x, y) lands at (cssWidth - y*scale, x*scale)
+        ctx.translate(cssWidth, 0);
+        ctx.rotate(Math.PI / 2);
+      }
+      ctx.scale(scale, scale);
+
+      ctx.lineWidth = 2;
+      ctx.strokeStyle = "#111";
+      ctx.textAlign = "center";
+      ctx.textBaseline = "middle";
+      ctx.font = "bold " + (isRotated ? 9 : 12) + "px sans-serif";
+      canvasBooths.forEach(b => {
+        ctx.fillStyle = b.color || "#bdbdbd";
+        ctx.fillRect(b.x, b.y, b.width, b.height);
+        ctx.strokeRect(b.x + 1, b.y + 1, b.width - 2, b.height - 2);
+
+        ctx.fillStyle = "#000";
+        ctx.save();
+        ctx.translate(b.x + b.width / 2, b.y + b.height / 2);
+        if (isRotated) ctx.rotate(-Math.PI / 2);
+        ctx.fillText(b.label, 0, 0);
+        ctx.restore();
+      });
+      canvasView = { scale: scale, cssWidth: cssWidth };
+    }
+
+    function onCanvasClick(e) {
+      if (!canvasView) return;
+      const rect = canvas.getBoundingClientRect();
+      const sx = e.clientX - rect.left;
+      const sy = e.clientY - rect.top;
+      // Undo the draw transform to get plane coordinates
+      const px = isRotated ? sy / canvasView.scale : sx / canvasView.scale;
+      const py = isRotated ? (canvasView.cssWidth - sx) / canvasView.scale : sy / canvasView.scale;
+      for (let i = canvasBooths.length - 1; i >= 0; i--) {
+        const b = canvasBooths[i];
+        if (px >= b.x && px <= b.x + b.width && py >= b.y && py <= b.y + b.height) {
+          showBoothDetails(b.label);
+          return;
+        }
+      }
     }
 
     function applyScaling() {
+      if (!planeWidth) return;  // booth data not loaded yet
+      if (renderer === "canvas") {
+        drawCanvas();
+        return;
+      }
       const ctn = document.getElementById("mapContainer");
       const wrapper = document.getElementById("mapWrapper");
       const pageContent = document.querySelector(".pageContent");
@@ -417,28 +565,164 @@ def index():
     window.onload = initMap;
     window.onresize = applyScaling;
     </script>
-  (% else %)
-    <p style="margin:20px;">No map_layout.json or no booths found.</p>
-  (% endif %)
 </body>
 </html>
+"""
+
+# Compiled once at import; every request is a single render pass over it
+map_template = app.jinja_env.from_string(MAP_TEMPLATE)
+
+booth_views = BoothViewCache(MAP_PROPERTY_NAME)
+shared_snapshots = SharedSnapshotReader()
+refresher = SnapshotRefresher(occupant_cache)
+
+def current_snapshot():
     """
+    shared mode: the snapshot the elected refresher last published. Before
+    the first publish: this worker's warm-start copy, else wait briefly for
+    the leader (SnapshotNotReady => 503). Workers never pull Buildium here.
+    local mode: this process's own stale-while-revalidate cache.
+    """
+    if SNAPSHOT_MODE != "shared":
+        return occupant_cache.get()
+    refresher.start()
+    return shared_snapshots.get() or occupant_cache.current() or shared_snapshots.wait()
+
+# Warm start: last saved data is ready before the first request (a SQLite read, no network)
+occupant_cache.warm_start()
 
-    from json import dumps
-    booth_json_str = dumps(booths)
-
-    # Pass new occupancy & rent collection values into the template
-    rendered = render_template_string(
-        html_template,
-        booths=booths,
-        occupancy_pct=occupancy_pct,
-        rent_collection_pct=rent_collection_pct
-    )
-    rendered = rendered.replace("__PW__", str(planeW))
-    rendered = rendered.replace("__PH__", str(planeH))
-    rendered = rendered.replace("__BOOTH_JSON__", booth_json_str)
-
-    return rendered
+booth_events = BoothEventHub(lambda: booth_views.get(current_snapshot(), get_layout()), booth_views)
+
+# The page itself carries no data, so it is rendered once and cached by browsers
+SHELL_MAX_AGE = 3600
+_shell = None
+
+def get_shell():
+    global _shell
+    if _shell is None:
+        html = render_template(map_template)
+        _shell = (html, hashlib.sha1(html.encode("utf-8")).hexdigest()[:20])
+    return _shell
+
+@app.route("/")
+def index():
+    html, etag = get_shell()
+    resp = Response(html, mimetype="text/html")
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = SHELL_MAX_AGE
+    return resp
+
+def buildium_unavailable(e):
+    # Partial data would paint paid-up booths as vacant; refuse instead
+    if isinstance(e, SnapshotNotReady):
+        resp = jsonify({"error": "Booth data is still loading from Buildium. Please try again in a few seconds."})
+        resp.headers["Retry-After"] = "5"
+    else:
+        print("Buildium fetch failed:", e)
+        resp = jsonify({"error": "Buildium is not responding right now. Please try again in a minute."})
+    resp.cache_control.no_store = True
+    return resp, 503
+
+@app.route("/api/booths")
+def booths_api():
+    try:
+        snapshot = current_snapshot()
+    except BuildiumError as e:
+        return buildium_unavailable(e)
+
+    view = booth_views.get(snapshot, get_layout())
+    if request.args.get("format") == "compact":
+        body, etag = view.compact()
+    else:
+        body, etag = view.body, view.etag
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    # Caches may keep it but must check back; an unchanged snapshot answers 304
+    resp.cache_control.no_cache = True
+    return resp
+
+@app.route("/api/booths/changes")
+def booth_changes_api():
+    since = request.args.get("since", type=int)
+    epoch = request.args.get("epoch", "")
+    try:
+        snapshot = current_snapshot()
+    except BuildiumError as e:
+        return buildium_unavailable(e)
+
+    view = booth_views.get(snapshot, get_layout())
+    resp = Response(booth_views.changes(view, since, epoch), mimetype="application/json")
+    resp.cache_control.no_store = True
+    return resp
+
+@app.route("/api/booths/<label>")
+def booth_detail_api(label):
+    try:
+        snapshot = current_snapshot()
+    except BuildiumError as e:
+        return buildium_unavailable(e)
+
+    detail = booth_views.get(snapshot, get_layout()).detail(label)
+    if detail is None:
+        return jsonify({"error": f"No booth {label!r} on the map."}), 404
+    body, etag = detail
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
+
+@app.route("/api/stats")
+def stats_api():
+    try:
+        snapshot = current_snapshot()
+    except BuildiumError as e:
+        return buildium_unavailable(e)
+
+    body, etag = booth_views.get(snapshot, get_layout()).stats_body()
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
+
+@app.route("/api/booths/events")
+def booth_events_api():
+    # EventSource sends Last-Event-ID on reconnect; the first connect uses the query string
+    if not booth_events.accepting():
+        # A 503 closes the EventSource for good; the page falls back to polling
+        resp = jsonify({"error": "Too many live update streams; poll /api/booths/changes instead."})
+        resp.cache_control.no_store = True
+        return resp, 503
+    epoch, since = parse_event_id(request.headers.get("Last-Event-ID"))
+    if since is None:
+        epoch, since = request.args.get("epoch"), request.args.get("since", type=int)
+    resp = Response(booth_events.stream(epoch, since), mimetype="text/event-stream")
+    resp.cache_control.no_cache = True
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+@app.after_request
+def compress_and_validate(resp):
+    # Conditional (304) handling lives here too, after the ETag is adjusted per encoding
+    return finish_response(resp, request)
+
+@app.route("/api/status")
+def status():
+    resp = jsonify({
+        "buildium_rate": rate_limiter_metrics(),
+        "fetch_timings": last_fetch_timings,
+        "unit_matches": last_match_stats,
+        # The snapshot this worker serves; in shared mode that is the published file,
+        # and occupant_cache is only the leader's builder (plus the warm-start copy)
+        "snapshot": shared_snapshots.status() if SNAPSHOT_MODE == "shared" else occupant_cache.status(),
+        "snapshot_cache": occupant_cache.status(),
+        "shared_snapshot": refresher.status(),
+        "resources": resource_status(),
+        "live_updates": booth_events.status(),
+        "compressed_bodies": {"hits": compressed_bodies.hits, "misses": compressed_bodies.misses},
+    })
+    resp.cache_control.no_store = True
+    return resp
 
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import queue
+import threading
+import time
+
+"""
+Server-Sent Events fan-out for live booth updates.
+One watcher thread (only while someone is subscribed) keeps the snapshot
+fresh and, whenever a new booth view version is published, sends the
+/api/booths/changes diff to every open stream. Streams carry
+id: <epoch>.<version> so a reconnecting EventSource resumes from its
+Last-Event-ID.
+"""
+
+SSE_CHECK_SECONDS = float(os.getenv("SSE_CHECK_SECONDS", "5"))
+SSE_HEARTBEAT_SECONDS = 15
+# Streams are closed after this long and the browser reconnects (keeps
+# proxies and dead connections from holding a stream indefinitely)
+SSE_MAX_STREAM_SECONDS = 600
+SSE_RETRY_MS = 5000
+# Open streams per worker; past it /api/booths/events answers 503 and the
+# page polls. Each stream holds a connection for as long as the tab is open:
+# cheap under the gevent worker in the Procfile, but a whole pool thread
+# under sync/gthread workers, so keep this well below --threads there.
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "200"))
+
+
+def parse_event_id(value):
+    """'<epoch>.<version>' => (epoch, version) or (None, None)."""
+    epoch, _, version = (value or "").partition(".")
+    if not epoch or not version.isdigit():
+        return None, None
+    return epoch, int(version)
+
+def format_event(body, view, event="changes"):
+    return f"id: {view.epoch}.{view.version}\nevent: {event}\ndata: {body.decode('utf-8')}\n\n"
+
+
+class BoothEventHub:
+
+    def __init__(self, current_view, views, max_streams=None):
+        """
+        current_view() => latest BoothView (raises if Buildium is down)
+        views          => the BoothViewCache, for diffs
+        """
+        self.current_view = current_view
+        self.views = views
+        self.max_streams = SSE_MAX_STREAMS if max_streams is None else max_streams
+        self.rejected = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._last = None
+        self.events_sent = 0
+
+    def _ensure_watcher(self):
+        with self._lock:
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, daemon=True)
+                self._watcher.start()
+
+    def _watch(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._watcher = None
+                    return
+            try:
+                view = self.current_view()
+            except Exception as e:
+                print("Live update check failed:", e)
+                view = None
+            if view is not None:
+                self._broadcast(view)
+            time.sleep(SSE_CHECK_SECONDS)
+
+    def _broadcast(self, view):
+        last = self._last
+        self._last = view
+        if last is None or last is view:
+            return
+        message = format_event(self.views.changes(view, last.version, last.epoch), view)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            q.put(message)
+        self.events_sent += len(subscribers)
+
+    def accepting(self):
+        """Room for another stream? Counts a refusal when not."""
+        with self._lock:
+            if len(self._subscribers) < self.max_streams:
+                return True
+            self.rejected += 1
+            return False
+
+    def stream(self, epoch, since):
+        """Generator for one client; (epoch, since) is where that client's map is."""
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.add(q)
+        self._ensure_watcher()
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            try:
+                view = self.current_view()
+            except Exception:
+                view = None
+            if self._last is None:
+                self._last = view
+            if view is not None and since is not None and (epoch, since) != (view.epoch, view.version):
+                # Catch up whatever happened while this client was disconnected
+                yield format_event(self.views.changes(view, since, epoch), view)
+
+            deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    yield q.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(q)
+
+    def status(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "max_streams": self.max_streams,
+                    "rejected": self.rejected, "events_sent": self.events_sent}
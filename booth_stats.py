@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+from booth_tokens import GENERAL_CATEGORY, PREFIX_CATEGORIES
+
+"""
+Occupancy, rent collection and outstanding balance, overall and per booth
+category, for one BoothView. Counted in the same pass that colours the
+booths, once per snapshot version; requests only read the result.
+
+Two kinds of category:
+  - booth type (figures()["booth_types"]), from the layout label and so
+    stable across snapshots: Kitchen ('K..'), Office ('OF..'), else a
+    general Booth. Occupancy is only reported for these.
+  - lease use (figures()["lease_uses"]), from the booth's best-ranked lease
+    (the same rule as its colour): Storage, Pantry, Kitchen, Office or
+    Booth. A numbered booth is only "Storage" while someone leases it as
+    storage, so occupancy would always read 100% there; uses report how
+    many booths are leased that way and how their tenants pay.
+  A 'K1' booth leased under "S24 K1" is an occupied Kitchen booth type
+  but a Storage lease use (and is coloured as storage).
+"""
+
+# Indexed by LeaseBooths.rank: prefix categories in priority order, then general booths
+CATEGORIES = tuple(category for _, category, _ in PREFIX_CATEGORIES) + (GENERAL_CATEGORY,)
+BOOTH_TYPES = ("Kitchen", "Office", GENERAL_CATEGORY)
+
+def booth_type(booth_key):
+    """Stable category of a layout booth, from its label."""
+    if booth_key.startswith("OF"):
+        return "Office"
+    if booth_key.startswith("K"):
+        return "Kitchen"
+    return GENERAL_CATEGORY
+
+def _pct(part, whole):
+    return round((part / whole * 100), 1) if whole else 0
+
+
+class BoothStats:
+    """
+    Filled by add_booth() / add_lease() while a view is built, then read via figures().
+    Occupants / on_time count (booth, lease) pairs, like the map's rent
+    collection figure always has; outstanding counts each lease once.
+    """
+
+    def __init__(self):
+        # booth type => [booths, occupied]
+        self.types = {t: [0, 0] for t in BOOTH_TYPES}
+        # lease use => [occupied booths, occupants, on_time, outstanding cents]
+        self.uses = {c: [0, 0, 0, 0] for c in CATEGORIES}
+
+    def add_booth(self, booth_key, rank=None, occupants=0, on_time=0):
+        """rank: best LeaseBooths.rank among the booth's leases; None => vacant."""
+        t = self.types[booth_type(booth_key)]
+        t[0] += 1
+        if rank is not None:
+            t[1] += 1
+            u = self.uses[CATEGORIES[rank]]
+            u[0] += 1
+            u[1] += occupants
+            u[2] += on_time
+
+    def add_lease(self, rank, balance):
+        # Whole cents, so the totals add up exactly
+        self.uses[CATEGORIES[rank]][3] += max(int(round(balance * 100)), 0)
+
+    def figures(self):
+        """
+        Overall figures, plus the two breakdowns under separate keys:
+          booth_types   by layout label: booths, occupied, occupancy_pct
+          lease_uses    by how occupied booths are leased: booths (leased as
+                        this), occupants, on_time, rent_collection_pct, outstanding
+        """
+        booths = sum(t[0] for t in self.types.values())
+        occupied = sum(t[1] for t in self.types.values())
+        occupants = sum(u[1] for u in self.uses.values())
+        on_time = sum(u[2] for u in self.uses.values())
+        return {
+            "occupancy_pct": _pct(occupied, booths),
+            "rent_collection_pct": _pct(on_time, occupants),
+            "outstanding": sum(u[3] for u in self.uses.values()) / 100,
+            "booth_types": {
+                kind: {"booths": t[0], "occupied": t[1], "occupancy_pct": _pct(t[1], t[0])}
+                for kind, t in self.types.items()
+            },
+            "lease_uses": {
+                use: {
+                    "booths": u[0],
+                    "occupants": u[1],
+                    "on_time": u[2],
+                    "rent_collection_pct": _pct(u[2], u[1]),
+                    "outstanding": u[3] / 100,
+                }
+                for use, u in self.uses.items()
+            },
+        }
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+from collections import namedtuple
+
+"""
+Booth tokens in a lease's location string ("S24", "P10 K1", "41 42"),
+parsed once per lease into structured records. Building the map is then
+lookups over those records: which booths a lease holds, and which
+category / colour it gives them.
+"""
+
+def parse_token(token):
+    """
+    If token starts with 'S' or 'P', strip that letter => numeric booth label.
+      e.g. 'S24' => prefix 'S', booth '24'
+           'P10' => prefix 'P', booth '10'
+    If token starts with 'K' or 'OF', keep entire token => lettered booth
+      e.g. 'K1' => prefix 'K', booth 'K1'
+           'OF2' => prefix 'OF', booth 'OF2'
+    Otherwise => no prefix => raw token as booth label.
+    """
+    up = token.upper().strip()
+    if up.startswith("S"):
+        return ("S", up[1:])
+    if up.startswith("P"):
+        return ("P", up[1:])
+    if up.startswith("K"):
+        return ("K", up)  # e.g. 'K3'
+    if up.startswith("OF"):
+        return ("OF", up) # e.g. 'OF2'
+    return ("", up)
+
+# prefix => (category, colour), in colour priority order S->P->K->OF
+PREFIX_CATEGORIES = (
+    ("S", "Storage", "#a7aae6"),
+    ("P", "Pantry", "#84c7ff"),
+    ("K", "Kitchen", "#72f0d5"),
+    ("OF", "Office", "#ffca7a"),
+)
+GENERAL_CATEGORY = "Booth"
+ON_TIME_COLOR = "#8ae89f"
+PAST_DUE_COLOR = "#ff8a8a"
+COMPANY_STORAGE_COLOR = "#bca4ff"
+
+_CATEGORY_BY_PREFIX = {pfx: category for pfx, category, _ in PREFIX_CATEGORIES}
+# rank => colour; the last rank (no prefix) is plain On Time
+_RANK_BY_PREFIX = {pfx: rank for rank, (pfx, _, _) in enumerate(PREFIX_CATEGORIES)}
+_COLOR_BY_RANK = [color for _, _, color in PREFIX_CATEGORIES] + [ON_TIME_COLOR]
+GENERAL_RANK = len(PREFIX_CATEGORIES)
+
+BoothAssignment = namedtuple("BoothAssignment", ["prefix", "booth_key", "category"])
+
+class LeaseBooths:
+    """
+    One lease's location, parsed:
+      assignments       BoothAssignment per token (empty for "" / "N/A")
+      rank              colour priority of its best prefix (GENERAL_RANK if none)
+      company_storage   occupant name mentions company storage
+    """
+
+    __slots__ = ("assignments", "rank", "company_storage")
+
+    def __init__(self, location, occupant_name):
+        loc_str = (location or "").strip()
+        assignments = []
+        rank = GENERAL_RANK
+        if loc_str and loc_str != "N/A":
+            for t in loc_str.split():
+                pfx, booth_lbl = parse_token(t)
+                # Force uppercase & strip
+                assignments.append(BoothAssignment(pfx, booth_lbl.upper().strip(),
+                                                   _CATEGORY_BY_PREFIX.get(pfx, GENERAL_CATEGORY)))
+                rank = min(rank, _RANK_BY_PREFIX.get(pfx, GENERAL_RANK))
+        self.assignments = tuple(assignments)
+        self.rank = rank
+        self.company_storage = "company storage" in (occupant_name or "").lower()
+
+# (lease_id, occupant_name, location) => LeaseBooths, reused across snapshots
+MEMO_SIZE = 4096
+_memo = {}
+
+def lease_booths(lease_id, occupant_name, location):
+    """LeaseBooths for one lease, parsed once per distinct (lease, name, location)."""
+    key = (lease_id, occupant_name, location)
+    parsed = _memo.get(key)
+    if parsed is None:
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+        parsed = _memo[key] = LeaseBooths(location, occupant_name)
+    return parsed
+
+def booth_color(total_bal, company_storage, rank):
+    """
+    Slightly darker pastel color logic:
+      1) If total_bal > 0 => Past Due => #ff8a8a
+      2) If occupant_name has 'company storage' => #bca4ff
+      3) Else best prefix among the booth's leases:
+         S => #a7aae6        (Storage)
+         P => #84c7ff        (Pantry)
+         K => #72f0d5        (Kitchen)
+         OF => #ffca7a       (Office)
+      4) Else => #8ae89f     (On Time)
+    """
+    if total_bal > 0:
+        return PAST_DUE_COLOR
+    if company_storage:
+        return COMPANY_STORAGE_COLOR
+    return _COLOR_BY_RANK[rank]
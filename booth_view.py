@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from booth_stats import BoothStats
+from booth_tokens import GENERAL_RANK, booth_color
+
+"""
+Everything the map draws for one (occupant snapshot, layout) pair:
+booth colours and occupants, occupancy/rent-collection figures, and the
+serialized /api/booths body with its ETag. Built once per snapshot
+version and shared by every request until the next snapshot lands.
+"""
+
+VACANT_COLOR = "#bdbdbd"  # vacant pastel gray
+
+# Per-booth fields in /api/booths; occupant details come from /api/booths/<label>
+SLIM_FIELDS = ("label", "x", "y", "width", "height", "color")
+
+class BoothView:
+    """
+    Built from a snapshot + layout, then numbered by publish().
+    """
+
+    def __init__(self, snapshot, layout, map_property_name):
+        self.snapshot = snapshot
+        self.snapshot_version = snapshot.version
+        self.layout_mtime = layout.mtime
+        self.source = snapshot.source
+        self.fetched_at = snapshot.fetched_at
+        self.version = None
+        self.epoch = None
+
+        filtered = [r for r in snapshot.rows if r.property_name == map_property_name]
+        print("\n=== VFM occupant data (map only) ===")
+        for row in filtered:
+            print(row)
+
+        # occupant_map => { booth_key: [ LeaseRecord, ... ] } (shared, not copied),
+        # plus per booth [total balance, company storage, best prefix rank] for its colour
+        occupant_map = {}
+        color_inputs = {}
+        stats = BoothStats()
+        for row in filtered:
+            lease = row.booths
+            if lease.assignments:
+                # Outstanding balance once per lease, under its best prefix
+                stats.add_lease(lease.rank, row.balance)
+            for a in lease.assignments:
+                occupant_map.setdefault(a.booth_key, []).append(row)
+                inputs = color_inputs.get(a.booth_key)
+                if inputs is None:
+                    inputs = color_inputs[a.booth_key] = [0, False, GENERAL_RANK]
+                inputs[0] += row.balance
+                inputs[1] = inputs[1] or lease.company_storage
+                inputs[2] = min(inputs[2], lease.rank)
+
+        # color-code each booth (on our own copies; the shared layout stays untouched)
+        booths = layout.booth_dicts()
+        for b, booth in zip(booths, layout.booths):
+            occupant_list  = occupant_map.get(booth.key, [])
+            if occupant_list:
+                inputs = color_inputs[booth.key]
+                b["occupants"] = occupant_list
+                b["color"]     = booth_color(*inputs)
+                on_time = sum(1 for occ in occupant_list if occ.balance <= 0)
+                stats.add_booth(booth.key, inputs[2], len(occupant_list), on_time)
+            else:
+                b["occupants"] = []
+                b["color"]     = VACANT_COLOR
+                stats.add_booth(booth.key)
+        self.booths = booths
+
+        # Occupancy & Rent Collection, overall and per category
+        self.figures = stats.figures()
+        self.occupancy_pct = self.figures["occupancy_pct"]
+        self.rent_collection_pct = self.figures["rent_collection_pct"]
+        # What the legend shows per category
+        self.legend_figures = {
+            "outstanding": self.figures["outstanding"],
+            # Legend entries are colours, i.e. lease uses
+            "lease_uses": {use: {f: v[f] for f in ("booths", "rent_collection_pct", "outstanding")}
+                           for use, v in self.figures["lease_uses"].items()},
+        }
+
+        self.by_label = {b["label"]: b for b in booths}
+        self.by_key = {booth.key: b for b, booth in zip(booths, layout.booths)}
+        # What the map needs up front; occupants load per booth on click
+        self.slim_by_label = {b["label"]: {f: b[f] for f in SLIM_FIELDS} for b in booths}
+
+        data_notice = None
+        if snapshot.source != "buildium":
+            saved = time.strftime("%b %d %I:%M %p", time.localtime(snapshot.fetched_at))
+            if snapshot.source == "store":
+                data_notice = f"Buildium is not responding; showing data saved {saved}."
+            elif snapshot.source == "stale":
+                data_notice = f"Updates from Buildium have stopped; showing data from {saved}."
+            else:
+                data_notice = f"Showing data saved {saved} while the latest loads from Buildium."
+
+        self.content = {
+            "plane_width": layout.plane_width,
+            "plane_height": layout.plane_height,
+            "booths": list(self.slim_by_label.values()),
+            "occupancy_pct": self.occupancy_pct,
+            "rent_collection_pct": self.rent_collection_pct,
+            **self.legend_figures,
+            "data_notice": data_notice,
+        }
+        self._diffs = {}
+        self._details = {}
+        self._compact = None
+        self._stats = None
+
+    def publish(self, version, epoch):
+        self.version = version
+        self.epoch = epoch
+        self.body = _dump(dict(self.content, version=version, epoch=epoch))
+        # Versions are per epoch, so the pair identifies these exact bytes
+        self.etag = f"{epoch}.{version}"
+
+    def compact(self):
+        """
+        (body, etag) for /api/booths?format=compact: the same payload with
+        booths as parallel columns plus a colour palette, so key names are
+        not repeated per booth. Built on first use, once per version.
+        """
+        if self._compact is None:
+            slim = list(self.slim_by_label.values())
+            palette = []
+            palette_index = {}
+            color_idx = []
+            for b in slim:
+                idx = palette_index.get(b["color"])
+                if idx is None:
+                    idx = palette_index[b["color"]] = len(palette)
+                    palette.append(b["color"])
+                color_idx.append(idx)
+            columns = {
+                "label": [b["label"] for b in slim],
+                "x": [b["x"] for b in slim],
+                "y": [b["y"] for b in slim],
+                "w": [b["width"] for b in slim],
+                "h": [b["height"] for b in slim],
+                "palette": palette,
+                "color": color_idx,
+            }
+            payload = dict(self.content, booths=columns, format="compact",
+                           version=self.version, epoch=self.epoch)
+            self._compact = (_dump(payload), f"{self.epoch}.{self.version}.c")
+        return self._compact
+
+    def stats_body(self):
+        """(body, etag) for /api/stats: the full figures for this version."""
+        if self._stats is None:
+            payload = dict(self.figures, version=self.version, epoch=self.epoch,
+                           data_notice=self.content["data_notice"])
+            self._stats = (_dump(payload), f"{self.epoch}.{self.version}.s")
+        return self._stats
+
+    def detail(self, label):
+        """(body, etag) for /api/booths/<label>, or None for an unknown booth."""
+        key = label.upper().strip()
+        cached = self._details.get(key)
+        if cached is not None:
+            return cached
+        b = self.by_key.get(key)
+        if b is None:
+            return None
+        body = _dump({"label": b["label"], "color": b["color"],
+                      "occupants": [r.occupant() for r in b["occupants"]]})
+        cached = self._details[key] = (body, hashlib.sha1(body).hexdigest()[:20])
+        return cached
+
+    def same_shape(self, other):
+        return (other.content["plane_width"] == self.content["plane_width"]
+                and other.content["plane_height"] == self.content["plane_height"]
+                and other.by_label.keys() == self.by_label.keys())
+
+
+def _dump(payload):
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+# How many past versions /api/booths/changes can diff against
+HISTORY_SIZE = 30
+
+class BoothViewCache:
+    """
+    Keeps the BoothView for the latest (snapshot, layout) plus the last
+    HISTORY_SIZE versions for /api/booths/changes. A view's version is its
+    snapshot's version; its epoch is the snapshot's epoch plus the layout
+    mtime, so every worker reading the same shared snapshot agrees on both,
+    and a layout edit forces clients to reload instead of diffing.
+    """
+
+    def __init__(self, map_property_name):
+        self.map_property_name = map_property_name
+        self._view = None
+        self._history = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _current(self, view, snapshot, layout):
+        return (view is not None and view.snapshot is snapshot
+                and view.snapshot_version == snapshot.version
+                and view.layout_mtime == layout.mtime)
+
+    def get(self, snapshot, layout):
+        view = self._view
+        if self._current(view, snapshot, layout):
+            return view
+        with self._lock:
+            view = self._view
+            if self._current(view, snapshot, layout):
+                return view
+            epoch = f"{snapshot.epoch}-{int(layout.mtime or 0):x}"
+            if view is not None and view.epoch == epoch and view.version == snapshot.version:
+                # Same data under a new Snapshot object (e.g. re-read from the shared file)
+                view.snapshot = snapshot
+                return view
+            built = BoothView(snapshot, layout, self.map_property_name)
+            built.publish(snapshot.version, epoch)
+            if view is not None and view.epoch != epoch:
+                self._history.clear()
+            self._history[built.version] = built
+            while len(self._history) > HISTORY_SIZE:
+                self._history.popitem(last=False)
+            self._view = built
+            return built
+
+    def changes(self, view, since, epoch):
+        """
+        /api/booths/changes body (bytes) taking a client from version
+        `since` to `view`. Says full=true when the client must refetch
+        /api/booths instead (unknown/expired version, other epoch, or the
+        layout itself changed).
+        """
+        cached = view._diffs.get((since, epoch))
+        if cached is not None:
+            return cached
+        old = self._history.get(since) if epoch == view.epoch else None
+        payload = {"version": view.version, "epoch": view.epoch}
+        if since == view.version and old is not None:
+            payload.update(full=False, booths=[])
+        elif old is None or not old.same_shape(view):
+            payload.update(full=True)
+        else:
+            changed = [view.slim_by_label[label] for label, b in view.by_label.items()
+                       if old.by_label[label] != b]
+            payload.update(full=False, booths=changed)
+        if not payload["full"]:
+            payload.update(
+                occupancy_pct=view.occupancy_pct,
+                rent_collection_pct=view.rent_collection_pct,
+                **view.legend_figures,
+                data_notice=view.content["data_notice"],
+            )
+        body = _dump(payload)
+        if len(view._diffs) < HISTORY_SIZE * 2:
+            view._diffs[(since, epoch)] = body
+        return body
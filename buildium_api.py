@@ -1,115 +1,368 @@
 #!/usr/bin/env python3
 
+import email.utils
 import os
+import random
+import threading
+import time
 import requests
-
-# Pull from environment variables
-BUILDIUM_CLIENT_ID = os.getenv("BUILDIUM_CLIENT_ID")
-BUILDIUM_CLIENT_SECRET = os.getenv("BUILDIUM_CLIENT_SECRET")
-if not BUILDIUM_CLIENT_ID:
-    raise ValueError("Missing BUILDIUM_CLIENT_ID environment variable")
-if not BUILDIUM_CLIENT_SECRET:
-    raise ValueError("Missing BUILDIUM_CLIENT_SECRET environment variable")
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 LEASES_URL = "https://api.buildium.com/v1/leases"
 OUTSTANDING_BALANCES_URL = "https://api.buildium.com/v1/leases/outstandingbalances"
 PROPERTIES_URL = "https://api.buildium.com/v1/rentals"
 UNITS_URL = "https://api.buildium.com/v1/rentals/units"
 
-headers = {
-    "x-buildium-client-id": BUILDIUM_CLIENT_ID,
-    "x-buildium-client-secret": BUILDIUM_CLIENT_SECRET,
-    "Content-Type": "application/json"
-}
-
-def fetch_all_leases(lease_statuses=("Active",)):
-    offset = 0
-    limit = 100
-    all_leases = []
-    while True:
-        params = {"offset": offset, "limit": limit, "leasestatuses": list(lease_statuses)}
-        r = requests.get(LEASES_URL, headers=headers, params=params)
+# Paging knobs (Buildium caps limit at 1000)
+PAGE_SIZE = int(os.getenv("BUILDIUM_PAGE_SIZE", "100"))
+MAX_WORKERS = int(os.getenv("BUILDIUM_MAX_WORKERS", "8"))
+
+# Transport knobs
+TIMEOUT = float(os.getenv("BUILDIUM_TIMEOUT", "15"))
+MAX_RETRIES = int(os.getenv("BUILDIUM_MAX_RETRIES", "3"))
+BACKOFF = float(os.getenv("BUILDIUM_BACKOFF", "0.5"))
+POOL_SIZE = int(os.getenv("BUILDIUM_POOL_SIZE", "32"))
+
+# Token bucket starting point, per endpoint (requests/second); never below MIN_RATE
+MIN_RATE = 0.5
+RATE_LIMIT = max(MIN_RATE, float(os.getenv("BUILDIUM_RATE_LIMIT", "10")))
+
+# Worth another try; anything else in 4xx is our fault and fails fast
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class BuildiumError(Exception):
+    """Buildium request failed after all retries."""
+
+
+class BuildiumConfigError(BuildiumError):
+    """Client can't be built (missing credentials)."""
+
+
+class BuildiumPartialResultError(BuildiumError):
+    """
+    A paginated fetch failed part way through.
+    .partial holds the rows fetched before the failing page.
+    """
+    def __init__(self, label, partial, cause=None):
+        super().__init__(f"Partial {label}: got {len(partial)} rows before error: {cause}")
+        self.label = label
+        self.partial = partial
+        self.cause = cause
+
+
+def _parse_retry_after(value):
+    """Retry-After is either delta-seconds or an HTTP date. Returns seconds or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _capacity(rate):
+    # A bucket must hold at least the one whole token acquire() takes, or a
+    # rate below 1/s would never refill far enough to let anyone through
+    return max(1.0, rate)
+
+
+class _EndpointBudget:
+    def __init__(self, rate, concurrency):
+        self.rate = rate
+        self.tokens = _capacity(rate)
+        self.updated = time.monotonic()
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+
+
+class RateLimiter:
+    """
+    Token bucket per endpoint, shared by every fetcher on a client.
+      - acquire() waits for both a token and a free concurrency slot.
+      - A 429 halves that endpoint's rate and concurrency and pauses it for
+        Retry-After seconds; each success creeps them back up (AIMD),
+        so we settle just under whatever Buildium is willing to serve.
+    """
+
+    def __init__(self, rate=None, max_concurrency=None):
+        self.max_rate = max(MIN_RATE, rate or RATE_LIMIT)
+        self.max_concurrency = max(1, max_concurrency or POOL_SIZE)
+        self._budgets = {}
+        self._cond = threading.Condition()
+
+    def _budget(self, endpoint):
+        b = self._budgets.get(endpoint)
+        if b is None:
+            b = self._budgets[endpoint] = _EndpointBudget(self.max_rate, self.max_concurrency)
+        return b
+
+    def acquire(self, endpoint):
+        with self._cond:
+            b = self._budget(endpoint)
+            while True:
+                now = time.monotonic()
+                b.tokens = min(_capacity(b.rate), b.tokens + (now - b.updated) * b.rate)
+                b.updated = now
+                wait = 0.0
+                if now < b.blocked_until:
+                    wait = b.blocked_until - now
+                elif b.in_flight >= b.concurrency:
+                    wait = None  # woken by release()
+                elif b.tokens < 1:
+                    wait = (1 - b.tokens) / b.rate
+                else:
+                    b.tokens -= 1
+                    b.in_flight += 1
+                    b.requests += 1
+                    return
+                self._cond.wait(wait)
+
+    def release(self, endpoint, throttled=False, retry_after=None):
+        with self._cond:
+            b = self._budget(endpoint)
+            b.in_flight -= 1
+            if throttled:
+                b.throttled += 1
+                b.rate = max(MIN_RATE, b.rate / 2)
+                b.tokens = min(b.tokens, 0)
+                b.concurrency = max(1, b.concurrency // 2)
+                pause = retry_after if retry_after is not None else 1.0 / b.rate
+                b.blocked_until = max(b.blocked_until, time.monotonic() + pause)
+            else:
+                b.rate = min(self.max_rate, b.rate + 0.05 * self.max_rate)
+                if b.concurrency < self.max_concurrency and b.requests % 10 == 0:
+                    b.concurrency += 1
+            self._cond.notify_all()
+
+    def metrics(self):
+        """Current budget per endpoint, for /api/status."""
+        with self._cond:
+            return {
+                endpoint: {
+                    "rate_per_sec": round(b.rate, 2),
+                    "concurrency": b.concurrency,
+                    "in_flight": b.in_flight,
+                    "requests": b.requests,
+                    "throttled": b.throttled,
+                    "blocked_for": round(max(0.0, b.blocked_until - time.monotonic()), 2),
+                }
+                for endpoint, b in self._budgets.items()
+            }
+
+
+class BuildiumClient:
+    """
+    Owns one pooled keep-alive Session, so every page after the first reuses
+    an open TLS connection. Transient errors (any requests transport error,
+    429/5xx) are retried with exponential backoff + jitter, and every
+    request passes through the client's RateLimiter.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, timeout=None,
+                 max_retries=None, backoff=None, page_size=None,
+                 max_workers=None, pool_size=None, rate_limiter=None):
+        # Pull from environment variables. Checked here rather than at import,
+        # so the app can boot (and serve saved data) without them.
+        self.client_id = client_id or os.getenv("BUILDIUM_CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("BUILDIUM_CLIENT_SECRET")
+        if not self.client_id:
+            raise BuildiumConfigError("Missing BUILDIUM_CLIENT_ID environment variable")
+        if not self.client_secret:
+            raise BuildiumConfigError("Missing BUILDIUM_CLIENT_SECRET environment variable")
+        self.timeout = timeout or TIMEOUT
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = BACKOFF if backoff is None else backoff
+        self.page_size = page_size or PAGE_SIZE
+        self.max_workers = max(1, max_workers or MAX_WORKERS)
+        self.rate_limiter = rate_limiter or RateLimiter(max_concurrency=pool_size)
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "x-buildium-client-id": self.client_id,
+            "x-buildium-client-secret": self.client_secret,
+            "Content-Type": "application/json"
+        })
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size or POOL_SIZE)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, params=None):
+        """GET with retries. Returns the Response or raises BuildiumError."""
+        attempt = 0
+        while True:
+            retry_after = None
+            self.rate_limiter.acquire(url)
+            throttled = False
+            try:
+                r = self.session.get(url, params=params, timeout=self.timeout)
+                throttled = r.status_code == 429
+                if throttled:
+                    retry_after = _parse_retry_after(r.headers.get("Retry-After"))
+                if r.status_code not in RETRY_STATUSES:
+                    r.raise_for_status()
+                    return r
+                cause = f"HTTP {r.status_code}"
+            except requests.HTTPError as e:
+                raise BuildiumError(f"GET {url} failed: {e}") from e
+            except requests.RequestException as e:
+                # Timeouts, resets, truncated/undecodable bodies: all worth another try
+                cause = e
+            finally:
+                self.rate_limiter.release(url, throttled, retry_after)
+
+            if attempt >= self.max_retries:
+                raise BuildiumError(f"GET {url} failed after {attempt + 1} attempts: {cause}")
+            if not throttled:
+                # 429s wait inside the limiter for Retry-After instead
+                delay = self.backoff * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay / 2))
+            attempt += 1
+
+    def fetch_page(self, url, params, offset, limit):
+        """
+        Fetch one page => (batch, total_count). Raises BuildiumError.
+        total_count comes from Buildium's X-Total-Count header when present.
+        """
+        r = self.get(url, dict(params, offset=offset, limit=limit))
+        total = r.headers.get("X-Total-Count")
         try:
-            r.raise_for_status()
-        except:
-            print("Error fetching leases.")
-            break
-
-        batch = r.json()
-        if not batch:
-            break
-        all_leases.extend(batch)
-        if len(batch) < limit:
-            break
-        offset += limit
-
-    return all_leases
-
-def fetch_outstanding_balances(lease_statuses=("Active",)):
-    offset = 0
-    limit = 100
-    all_balances = []
-    while True:
-        params = {"offset": offset, "limit": limit, "leasestatuses": list(lease_statuses)}
-        r = requests.get(OUTSTANDING_BALANCES_URL, headers=headers, params=params)
+            batch = r.json()
+        except ValueError as e:
+            raise BuildiumError(f"GET {url} returned a body that is not JSON: {e}") from e
+        return batch, (int(total) if total and total.isdigit() else None)
+
+    def fetch_paginated(self, url, params=None, label="records"):
+        """
+        Page through a Buildium list endpoint concurrently.
+          1) Fetch the first page and read X-Total-Count.
+          2) If the total is known => fetch all remaining offsets in parallel.
+             Otherwise => probe in waves of max_workers pages until a short page.
+          3) Reassemble the batches in offset order.
+        If a page still fails after retries, raises BuildiumPartialResultError
+        carrying the contiguous rows fetched before it.
+        """
+        params = dict(params or {})
+        limit = self.page_size
+
         try:
-            r.raise_for_status()
-        except:
-            print("Error fetching outstanding balances.")
-            break
+            first, total = self.fetch_page(url, params, 0, limit)
+        except BuildiumError as e:
+            raise BuildiumPartialResultError(label, [], e) from e
+        if not first:
+            return []
+        if len(first) < limit:
+            return list(first)
+
+        pages = {0: first}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            if total is not None:
+                offsets = list(range(limit, total, limit))
+                futures = {off: pool.submit(self.fetch_page, url, params, off, limit) for off in offsets}
+                for off in offsets:
+                    try:
+                        pages[off] = futures[off].result()[0]
+                    except BuildiumError as e:
+                        error = e
+                        for fut in futures.values():
+                            fut.cancel()
+                        break
+            else:
+                next_offset = limit
+                done = False
+                while not done:
+                    offsets = [next_offset + i * limit for i in range(self.max_workers)]
+                    futures = [pool.submit(self.fetch_page, url, params, off, limit) for off in offsets]
+                    for off, fut in zip(offsets, futures):
+                        try:
+                            batch = fut.result()[0]
+                        except BuildiumError as e:
+                            error = e
+                            done = True
+                            break
+                        if batch:
+                            pages[off] = batch
+                        if len(batch or []) < limit:
+                            done = True
+                            break
+                    next_offset = offsets[-1] + limit
+
+        # Keep pages only up to the first gap, so a failed page never leaves a hole
+        all_rows = []
+        offset = 0
+        while offset in pages:
+            all_rows.extend(pages[offset])
+            if len(pages[offset]) < limit:
+                break
+            offset += limit
+
+        if error is not None:
+            print(f"Error fetching {label}: {error}")
+            raise BuildiumPartialResultError(label, all_rows, error)
+        return all_rows
 
-        data_batch = r.json()
-        if not data_batch:
-            break
-        all_balances.extend(data_batch)
-        if len(data_batch) < limit:
-            break
-        offset += limit
+    def fetch_all_leases(self, lease_statuses=("Active",), updated_since=None, property_ids=None):
+        """
+        lease_statuses=None => every status (needed for deltas, so leases
+        that just moved to Past come back too).
+        updated_since => only leases Buildium changed at/after this UTC datetime.
+        property_ids => only leases on these properties (None => all).
+        """
+        params = {}
+        if lease_statuses:
+            params["leasestatuses"] = list(lease_statuses)
+        if property_ids:
+            params["propertyids"] = list(property_ids)
+        if updated_since is not None:
+            params["lastupdatedfrom"] = updated_since.strftime("%Y-%m-%d %H:%M:%S")
+        return self.fetch_paginated(LEASES_URL, params, label="leases")
 
-    return all_balances
+    def fetch_outstanding_balances(self, lease_statuses=("Active",), property_ids=None):
+        params = {"leasestatuses": list(lease_statuses)}
+        if property_ids:
+            params["propertyids"] = list(property_ids)
+        return self.fetch_paginated(OUTSTANDING_BALANCES_URL, params, label="outstanding balances")
+
+    def fetch_all_properties(self):
+        return self.fetch_paginated(PROPERTIES_URL, label="properties")
+
+    def fetch_all_units(self, property_ids=None):
+        params = {"propertyids": list(property_ids)} if property_ids else None
+        return self.fetch_paginated(UNITS_URL, params, label="units")
+
+
+_default_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Shared process-wide client, created on first use."""
+    global _default_client
+    with _client_lock:
+        if _default_client is None:
+            _default_client = BuildiumClient()
+        return _default_client
+
+def rate_limiter_metrics():
+    """Shared client's RateLimiter.metrics(); empty until a client exists."""
+    client = _default_client
+    return client.rate_limiter.metrics() if client is not None else {}
+
+def fetch_all_leases(lease_statuses=("Active",), updated_since=None, property_ids=None):
+    return get_client().fetch_all_leases(lease_statuses, updated_since, property_ids)
+
+def fetch_outstanding_balances(lease_statuses=("Active",), property_ids=None):
+    return get_client().fetch_outstanding_balances(lease_statuses, property_ids)
 
 def fetch_all_properties():
-    offset = 0
-    limit = 100
-    all_props = []
-    while True:
-        params = {"offset": offset, "limit": limit}
-        r = requests.get(PROPERTIES_URL, headers=headers, params=params)
-        try:
-            r.raise_for_status()
-        except:
-            print("Error fetching properties.")
-            break
-
-        batch = r.json()
-        if not batch:
-            break
-        all_props.extend(batch)
-        if len(batch) < limit:
-            break
-        offset += limit
-
-    return all_props
-
-def fetch_all_units():
-    offset = 0
-    limit = 100
-    all_units = []
-    while True:
-        params = {"offset": offset, "limit": limit}
-        r = requests.get(UNITS_URL, headers=headers, params=params)
-        try:
-            r.raise_for_status()
-        except:
-            print("Error fetching units.")
-            break
-
-        batch = r.json()
-        if not batch:
-            break
-        all_units.extend(batch)
-        if len(batch) < limit:
-            break
-        offset += limit
-
-    return all_units
\ No newline at end of file
+    return get_client().fetch_all_properties()
+
+def fetch_all_units(property_ids=None):
+    return get_client().fetch_all_units(property_ids)
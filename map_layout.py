@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+"""
+Parsed, read-only view of map_layout.json.
+The file is parsed once and re-parsed only when its mtime changes, so the
+request path does a stat() instead of open + json.load. Nothing here is
+mutated after load, which makes one Layout safe to share across threads;
+requests lay occupants/colours over it in their own dicts.
+"""
+
+LAYOUT_PATH = os.getenv("MAP_LAYOUT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_layout.json"))
+
+DEFAULT_PLANE_WIDTH = 600
+DEFAULT_PLANE_HEIGHT = 1000
+
+# key => label.strip().upper(), what occupant locations are matched against
+Booth = namedtuple("Booth", ["label", "key", "x", "y", "width", "height"])
+
+
+class Layout:
+
+    def __init__(self, plane_width, plane_height, booths, mtime=None):
+        self.plane_width = plane_width
+        self.plane_height = plane_height
+        self.booths = tuple(booths)
+        self.by_key = MappingProxyType({b.key: b for b in self.booths})
+        self.mtime = mtime
+
+    def booth_dicts(self):
+        """Fresh geometry dicts, one per booth, for a request to decorate."""
+        return [{"label": b.label, "x": b.x, "y": b.y, "width": b.width, "height": b.height}
+                for b in self.booths]
+
+
+EMPTY_LAYOUT = Layout(DEFAULT_PLANE_WIDTH, DEFAULT_PLANE_HEIGHT, [])
+
+def parse_layout(map_data, mtime=None):
+    booths = []
+    for b in map_data.get("booths", []):
+        label = b.get("label", "")
+        booths.append(Booth(label, label.upper().strip(), b.get("x", 0), b.get("y", 0),
+                            b.get("width", 0), b.get("height", 0)))
+    return Layout(map_data.get("planeWidth", DEFAULT_PLANE_WIDTH),
+                  map_data.get("planeHeight", DEFAULT_PLANE_HEIGHT),
+                  booths, mtime)
+
+
+class LayoutLoader:
+    """
+    Keeps the last layout that parsed. A missing or half-written file
+    leaves it in place (one message per bad mtime) until a good save lands.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or LAYOUT_PATH
+        self._layout = EMPTY_LAYOUT
+        self._bad_mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current layout; re-parses the file only if its mtime moved."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return self._layout
+        if mtime == self._layout.mtime or mtime == self._bad_mtime:
+            return self._layout
+        with self._lock:
+            if mtime != self._layout.mtime and mtime != self._bad_mtime:
+                try:
+                    with open(self.path, "r") as f:
+                        self._layout = parse_layout(json.load(f), mtime)
+                    self._bad_mtime = None
+                except (OSError, ValueError) as e:
+                    print("Could not load map layout, keeping the previous one:", e)
+                    self._bad_mtime = mtime
+            return self._layout
+
+
+layout_loader = LayoutLoader()
+
+def get_layout():
+    return layout_loader.get()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+from booth_tokens import lease_booths
+
+"""
+LeaseRecord: one merged occupant row (lease + balance + unit location),
+slotted so a snapshot of a few hundred leases stays small. Booths on the
+map hold references to these records rather than copies, and every JSON
+form of them (snapshot digest, shared snapshot file, booth details) goes
+through as_row() / occupant() below.
+"""
+
+class LeaseRecord:
+    """
+    lease_id, occupant_name, lease_end_date, location ("41 42" / "5" / "N/A"),
+    balance, property_name, plus booths (the parsed location, LeaseBooths).
+    """
+
+    __slots__ = ("lease_id", "occupant_name", "lease_end_date", "location",
+                 "balance", "property_name", "booths", "_occupant")
+
+    # Order of as_row(); also the keys of the old dict rows
+    FIELDS = ("lease_id", "occupant_name", "lease_end_date", "location",
+              "balance", "property_name")
+
+    def __init__(self, lease_id, occupant_name, lease_end_date, location, balance, property_name):
+        self.lease_id = lease_id
+        self.occupant_name = occupant_name
+        self.lease_end_date = lease_end_date
+        self.location = location
+        self.balance = balance
+        self.property_name = property_name
+        self.booths = lease_booths(lease_id, occupant_name, location)
+        self._occupant = None
+
+    @classmethod
+    def from_row(cls, row):
+        """From as_row() output, or a dict row as older shared snapshot files hold."""
+        if isinstance(row, dict):
+            return cls(*(row[f] for f in cls.FIELDS))
+        return cls(*row)
+
+    def as_row(self):
+        return (self.lease_id, self.occupant_name, self.lease_end_date,
+                self.location, self.balance, self.property_name)
+
+    def occupant(self):
+        """What /api/booths/<label> shows for this lease; built once per record."""
+        if self._occupant is None:
+            self._occupant = {
+                "occupant_name": self.occupant_name,
+                "lease_id": self.lease_id,
+                "lease_end": self.lease_end_date,
+                "balance": self.balance,
+                "location": (self.location or "").strip(),
+            }
+        return self._occupant
+
+    def __eq__(self, other):
+        if not isinstance(other, LeaseRecord):
+            return NotImplemented
+        return self.as_row() == other.as_row()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(zip(self.FIELDS, self.as_row())))
+
+
+def encode_rows(records):
+    """JSON-ready rows: one list per record, in FIELDS order."""
+    return [r.as_row() for r in records]
+
+def decode_rows(rows):
+    return [LeaseRecord.from_row(row) for row in rows]
@@ -1,46 +1,347 @@
 #!/usr/bin/env python3
 
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlite3 import Error as SQLiteError
 from buildium_api import (
+    BuildiumError,
     fetch_all_leases,
     fetch_outstanding_balances,
     fetch_all_properties,
     fetch_all_units
 )
+from occupant_records import LeaseRecord, encode_rows
+from occupant_store import get_store
 
 """
 Merges occupant data from Buildium with AddressLine1 => location
-Returns a list of dicts:
+Returns a list of LeaseRecord (occupant_records.py):
 [
-  {
-    "lease_id": <int>,
-    "occupant_name": <str>,
-    "lease_end_date": <str>,
-    "location": "41 42" or "5" or "N/A",
-    "balance": <float>,
-    "property_name": <str>
-  },
+  LeaseRecord(
+    lease_id=<int>,
+    occupant_name=<str>,
+    lease_end_date=<str>,
+    location="41 42" or "5" or "N/A",
+    balance=<float>,
+    property_name=<str>
+  ),
   ...
 ]
 """
 
-def get_units_map():
-    units = fetch_all_units()
+# The one property the map page draws
+MAP_PROPERTY_NAME = os.getenv("MAP_PROPERTY_NAME", "Visitors Flea Market")
+
+def get_units_map(property_ids=None):
+    units = fetch_all_units(property_ids)
     return {u["Id"]: u for u in units if "Id" in u}
 
 def get_property_map():
     props = fetch_all_properties()
     return {p["Id"]: p.get("Name","Unknown Property") for p in props if "Id" in p}
 
-def get_leases_data():
-    leases = fetch_all_leases(["Active"])
+class ResourceCache:
+    """
+    Cache for one Buildium resource with its own policy:
+      ttl       => after this many seconds the next get() refetches
+      max_stale => if a refetch fails, keep serving the old value until it is
+                   this old, then evict it and let the error through
+                   (0 => never serve stale, always raise)
+    """
+
+    def __init__(self, name, loader, ttl, max_stale=0):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._value = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        with self._lock:
+            now = time.time()
+            if self._loaded_at is not None and now - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            try:
+                self._value = self.loader()
+                self._loaded_at = time.time()
+            except Exception as e:
+                if self._loaded_at is None or now - self._loaded_at >= self.max_stale:
+                    self._invalidate_locked()
+                    raise
+                print(f"Refetch of {self.name} failed, serving cached copy:", e)
+            return self._value
+
+    def _invalidate_locked(self):
+        self._value = None
+        self._loaded_at = None
+
+    def invalidate(self):
+        with self._lock:
+            self._invalidate_locked()
+
+    def status(self):
+        age = time.time() - self._loaded_at if self._loaded_at else None
+        return {
+            "ttl": self.ttl,
+            "age": round(age, 1) if age is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+LEASE_SYNC_MODE = os.getenv("LEASE_SYNC_MODE", "delta")  # "delta" or "full"
+LEASE_FULL_SYNC_INTERVAL = float(os.getenv("LEASE_FULL_SYNC_INTERVAL", "3600"))
+# Re-ask for a little before the watermark to cover clock skew; upserts are idempotent
+LEASE_SYNC_OVERLAP = timedelta(minutes=5)
+
+class LeaseSync:
+    """
+    Holds the active lease set locally and keeps it current with deltas:
+      - first call, or every LEASE_FULL_SYNC_INTERVAL seconds => full pull
+        (the only way to notice leases deleted outright in Buildium)
+      - otherwise => ask only for leases updated since the last watermark,
+        across all statuses; Active ones are upserted, the rest dropped.
+    """
+
+    def __init__(self, lease_statuses=("Active",), property_ids=None):
+        self.lease_statuses = tuple(lease_statuses)
+        self.property_ids = property_ids
+        self._leases = {}
+        self._watermark = None
+        self._last_full = 0.0
+        self.last_mode = None
+        self.last_changed = 0
+
+    def reset(self):
+        self._leases = {}
+        self._watermark = None
+        self._last_full = 0.0
+
+    def sync(self):
+        started = datetime.now(timezone.utc)
+        full_due = time.time() - self._last_full >= LEASE_FULL_SYNC_INTERVAL
+        if LEASE_SYNC_MODE != "delta" or self._watermark is None or full_due:
+            leases = fetch_all_leases(list(self.lease_statuses), property_ids=self.property_ids)
+            self._leases = {l["Id"]: l for l in leases if "Id" in l}
+            self._last_full = time.time()
+            self.last_mode = "full"
+            self.last_changed = len(self._leases)
+        else:
+            changed = fetch_all_leases(None, updated_since=self._watermark - LEASE_SYNC_OVERLAP,
+                                       property_ids=self.property_ids)
+            for lease in changed:
+                lease_id = lease.get("Id")
+                if lease_id is None:
+                    continue
+                if lease.get("LeaseStatus", "Active") in self.lease_statuses:
+                    self._leases[lease_id] = lease
+                else:
+                    self._leases.pop(lease_id, None)
+            self.last_mode = "delta"
+            self.last_changed = len(changed)
+        # Only reached when the pull succeeded, so a failed delta is retried from the same point
+        self._watermark = started.replace(tzinfo=None)
+        return list(self._leases.values())
+
+    def status(self):
+        return {
+            "mode": self.last_mode,
+            "changed": self.last_changed,
+            "held": len(self._leases),
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+        }
+
+LEASES_TTL = float(os.getenv("LEASES_TTL", "0"))
+BALANCES_TTL = float(os.getenv("BALANCES_TTL", "0"))
+UNITS_TTL = float(os.getenv("UNITS_TTL", "21600"))
+PROPERTIES_TTL = float(os.getenv("PROPERTIES_TTL", "21600"))
+
+# Rentals are always listed in full (we need them to resolve names), so one cache serves every scope
+properties_cache = ResourceCache("properties", get_property_map, ttl=PROPERTIES_TTL, max_stale=86400)
+
+class ResourceScope:
+    """
+    The resource caches for one set of property ids (None => whole account).
+    Units and rentals barely change; leases and balances are what the map is about.
+    """
+
+    def __init__(self, property_ids=None):
+        self.property_ids = property_ids
+        self.lease_sync = LeaseSync(["Active"], property_ids)
+        self.caches = {
+            "leases": ResourceCache("leases", self.lease_sync.sync, ttl=LEASES_TTL),
+            "balances": ResourceCache(
+                "balances", lambda: fetch_outstanding_balances(["Active"], property_ids),
+                ttl=BALANCES_TTL),
+            "units": ResourceCache(
+                "units", lambda: get_units_map(property_ids),
+                ttl=UNITS_TTL, max_stale=86400),
+            "properties": properties_cache,
+        }
+
+    def invalidate(self, *names):
+        for name in names or self.caches:
+            self.caches[name].invalidate()
+            if name == "leases":
+                self.lease_sync.reset()
+
+    def status(self):
+        status = {name: c.status() for name, c in self.caches.items()}
+        status["lease_sync"] = self.lease_sync.status()
+        return status
+
+_scopes = {}
+_scopes_lock = threading.Lock()
+
+def get_scope(property_ids=None):
+    key = tuple(sorted(property_ids)) if property_ids else None
+    with _scopes_lock:
+        if key not in _scopes:
+            _scopes[key] = ResourceScope(list(key) if key else None)
+        return _scopes[key]
+
+_property_ids_by_name = {}
+
+def resolve_property_ids(names):
+    """Property names => sorted Buildium ids, cached until properties are invalidated."""
+    key = tuple(sorted(names))
+    if key not in _property_ids_by_name:
+        prop_map = properties_cache.get()
+        ids = sorted(pid for pid, name in prop_map.items() if name in names)
+        if not ids:
+            return []  # don't cache a miss; the property may just not be loaded yet
+        _property_ids_by_name[key] = ids
+    return _property_ids_by_name[key]
+
+def invalidate_resources(*names):
+    """Drop cached resources (all of them when no names given) so the next fetch re-pulls them."""
+    with _scopes_lock:
+        scopes = list(_scopes.values())
+    for scope in scopes:
+        scope.invalidate(*names)
+    if not names or "properties" in names:
+        properties_cache.invalidate()
+        _property_ids_by_name.clear()
+
+def resource_status():
+    with _scopes_lock:
+        scopes = dict(_scopes)
+    return {
+        ",".join(map(str, key)) if key else "all": scope.status()
+        for key, scope in scopes.items()
+    }
+
+# Seconds each resource leg took on the most recent fetch_resources() call
+last_fetch_timings = {}
+
+def _timed(name, fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        last_fetch_timings[name] = round(time.perf_counter() - start, 3)
+
+def fetch_resources(property_ids=None):
+    """
+    Start all four Buildium pulls at once and wait for them together,
+    so the wall time is the slowest leg instead of the sum. Each leg goes
+    through its ResourceCache, so a still-fresh resource costs nothing.
+    property_ids limits leases, balances and units to those properties.
+    Returns (leases, balances, units_map, prop_map).
+    """
+    caches = get_scope(property_ids).caches
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(caches)) as pool:
+        futures = {name: pool.submit(_timed, name, cache.get)
+                   for name, cache in caches.items()}
+        results = {name: fut.result() for name, fut in futures.items()}
+    last_fetch_timings["total"] = round(time.perf_counter() - start, 3)
+    print("Buildium fetch timings (s):", last_fetch_timings)
+    return results["leases"], results["balances"], results["units"], results["properties"]
+
+def get_leases_data(property_ids=None, from_store=False):
+    """
+    property_ids     => only these Buildium properties (None => whole account).
+    from_store=False => pull from Buildium and save the pull to the local store.
+    from_store=True  => merge whatever the local store last saved (no network).
+    """
+    if from_store:
+        resources = get_store().load(property_ids)
+    else:
+        resources = fetch_resources(property_ids)
+        try:
+            get_store().save(*resources, property_ids=property_ids)
+        except SQLiteError as e:
+            print("Could not save Buildium pull to local store:", e)
+    return merge_leases(*resources)
+
+def _normalise_address(value):
+    return " ".join(str(value or "").upper().replace("#", " ").replace(",", " ").split())
+
+class UnitIndex:
+    """
+    Lookup tables built once per merge so matching a lease is O(1):
+      by_id              RentalUnitId => unit
+      by_prop_number     (PropertyId, UnitNumber) => unit
+      by_number          UnitNumber => first unit with it (the old fallback)
+      by_address         normalised AddressLine1 => unit
+    """
+
+    def __init__(self, units_map):
+        self.by_id = units_map
+        self.by_prop_number = {}
+        self.by_number = {}
+        self.by_address = {}
+        for u in units_map.values():
+            number = u.get("UnitNumber")
+            if number is not None:
+                self.by_prop_number.setdefault((u.get("PropertyId"), number), u)
+                self.by_number.setdefault(number, u)
+            addr = _normalise_address(u.get("Address", {}).get("AddressLine1"))
+            if addr:
+                self.by_address.setdefault(addr, u)
+
+    def match(self, lease):
+        """Returns (unit or None, how) with how in id/number/address/unmatched."""
+        unit_id = lease.get("RentalUnitId")
+        if unit_id and unit_id in self.by_id:
+            return self.by_id[unit_id], "id"
+        number = lease.get("UnitNumber", "Unknown")
+        unit = self.by_prop_number.get((lease.get("PropertyId"), number)) or self.by_number.get(number)
+        if unit:
+            return unit, "number"
+        unit = self.by_address.get(_normalise_address(number))
+        if unit:
+            return unit, "address"
+        return None, "unmatched"
+
+# How leases were matched to units on the most recent merge
+last_match_stats = {}
+
+def get_map_leases_data():
+    """get_leases_data() scoped to MAP_PROPERTY_NAME; whole account if the name can't be resolved."""
+    property_ids = resolve_property_ids([MAP_PROPERTY_NAME])
+    if not property_ids:
+        print(f"Property {MAP_PROPERTY_NAME!r} not found; fetching every property.")
+    return get_leases_data(property_ids=property_ids or None)
+
+def merge_leases(leases, balances, units_map, prop_map):
     if not leases:
         return []
 
-    balances = fetch_outstanding_balances(["Active"])
     bal_map = {b["LeaseId"]: b.get("TotalBalance", 0.0) for b in balances}
-
-    units_map = get_units_map()
-    prop_map = get_property_map()
+    index = UnitIndex(units_map)
+    stats = {"id": 0, "number": 0, "address": 0, "unmatched": 0}
 
     data = []
     for lease in leases:
@@ -51,16 +352,8 @@ def get_leases_data():
         prop_name = prop_map.get(prop_id, "Unknown Property")
         bal = bal_map.get(lease_id, 0.0)
 
-        potential_unit_id = lease.get("RentalUnitId")
-        unit_info = None
-        if potential_unit_id and potential_unit_id in units_map:
-            unit_info = units_map[potential_unit_id]
-        else:
-            # fallback match occupant
-            for u in units_map.values():
-                if u.get("UnitNumber") == occupant:
-                    unit_info = u
-                    break
+        unit_info, how = index.match(lease)
+        stats[how] += 1
 
         if unit_info:
             addr = unit_info.get("Address", {})
@@ -70,13 +363,231 @@ def get_leases_data():
         else:
             loc = "N/A"
 
-        data.append({
-            "lease_id": lease_id,
-            "occupant_name": occupant,
-            "lease_end_date": end_date,
-            "location": loc,
-            "balance": bal,
-            "property_name": prop_name
-        })
+        data.append(LeaseRecord(lease_id, occupant, end_date, loc, bal, prop_name))
+
+    last_match_stats.clear()
+    last_match_stats.update(stats)
+    return data
+
+SNAPSHOT_TTL = float(os.getenv("SNAPSHOT_TTL", "60"))
+
+def snapshot_digest(rows, source, fetched_at):
+    """Identity of what a snapshot would show; equal digests => keep the version."""
+    key = {"rows": encode_rows(rows), "source": source}
+    if source != "buildium":
+        key["saved_at"] = fetched_at  # the page shows when the saved copy is from
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class Snapshot:
+    """
+    One merged get_leases_data() result plus when it was built.
+    source is "buildium", "store" (Buildium failed, served from the local
+    copy), "saved" (local copy loaded at boot while Buildium is re-pulled)
+    or "stale" (shared file no longer being published; see snapshot_share).
+    version only moves when the rows change, and is only comparable
+    within one epoch (the process or shared file that numbered it).
+    """
+
+    def __init__(self, rows, version, fetched_at=None, source="buildium", epoch="", digest=None):
+        self.rows = rows
+        self.version = version
+        self.fetched_at = fetched_at or time.time()
+        self.source = source
+        self.epoch = epoch
+        self.digest = digest or snapshot_digest(rows, source, fetched_at)
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Collapse concurrent calls into one: the first caller runs fn, everyone
+    who arrives while it is running waits and gets the same result (or
+    the same exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flight = None
+        self.waiting = 0
+        self.calls = 0
+        self.executions = 0
+
+    def do(self, fn):
+        with self._lock:
+            self.calls += 1
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+                self.executions += 1
+            else:
+                self.waiting += 1
+
+        if leader:
+            try:
+                flight.result = fn()
+            except Exception as e:
+                flight.error = e
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+        else:
+            flight.done.wait()
+            with self._lock:
+                self.waiting -= 1
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            coalesced = self.calls - self.executions
+            return {
+                "waiting": self.waiting,
+                "calls": self.calls,
+                "fetches": self.executions,
+                "coalescing_ratio": round(coalesced / self.calls, 3) if self.calls else 0.0,
+            }
+
+class SnapshotCache:
+    """
+    Stale-while-revalidate cache of the merged occupant data.
+      - No snapshot yet => load synchronously (first request pays once).
+      - Fresh => return it.
+      - Older than ttl => return it anyway and rebuild in a background thread.
+    A failed background refresh keeps serving the previous snapshot. If
+    there is no previous snapshot, fallback() => (rows, saved_at) is tried
+    and its result is served already stale, so the next get() retries.
+    warm_start() seeds the cache from fallback() at boot; that snapshot is
+    served but always counts as stale until a Buildium load replaces it.
+    """
+
+    def __init__(self, loader, ttl=None, fallback=None):
+        self.loader = loader
+        self.fallback = fallback
+        self.ttl = SNAPSHOT_TTL if ttl is None else ttl
+        self._snapshot = None
+        self._version = 0
+        # Random per process: this cache's version numbers mean nothing elsewhere
+        self.epoch = os.urandom(4).hex()
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._flight = SingleFlight()
+
+    def _load(self):
+        return self._flight.do(self._build)
+
+    def _build(self):
+        fetched_at, source = None, "buildium"
+        try:
+            rows = self.loader()
+        except BuildiumError as e:
+            current = self._snapshot
+            if current is not None and current.source == "saved":
+                # Warm-start copy: keep it, but now say Buildium is down
+                rows, fetched_at = current.rows, current.fetched_at
+            elif current is not None or self.fallback is None:
+                raise
+            else:
+                fallback = self.fallback()
+                if fallback is None:
+                    raise
+                rows, fetched_at = fallback
+            source = "store"
+            print("Buildium unavailable, serving local store:", e)
+        digest = snapshot_digest(rows, source, fetched_at)
+        with self._lock:
+            current = self._snapshot
+            if current is not None and current.digest == digest:
+                # Nothing changed: same version (and ETags), just fresher
+                current.fetched_at = fetched_at or time.time()
+                return current
+            self._version += 1
+            self._snapshot = Snapshot(rows, self._version, fetched_at, source, self.epoch, digest)
+            return self._snapshot
+
+    def _refresh_in_background(self):
+        try:
+            self._load()
+        except Exception as e:
+            print("Background snapshot refresh failed:", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        snap = self._snapshot
+        if snap is None:
+            return self._load()
+        if snap.age >= self.ttl or snap.source == "saved":
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return snap
+
+    def warm_start(self):
+        """
+        Seed an empty cache with the last saved data (source "saved"), so the
+        first get() serves it instantly and rebuilds in the background.
+        Returns the snapshot, or None if nothing was saved.
+        """
+        if self._snapshot is not None or self.fallback is None:
+            return self._snapshot
+        saved = self.fallback()
+        if saved is None:
+            return None
+        rows, saved_at = saved
+        with self._lock:
+            if self._snapshot is None:
+                self._version += 1
+                self._snapshot = Snapshot(rows, self._version, saved_at, "saved", self.epoch)
+            return self._snapshot
+
+    def current(self):
+        """Whatever snapshot is held, without triggering a load or refresh."""
+        return self._snapshot
+
+    def refresh(self):
+        """Block until a new snapshot is built, joining any build already in flight."""
+        return self._load()
+
+    def status(self):
+        snap = self._snapshot
+        return {
+            "version": snap.version if snap else None,
+            "age": round(snap.age, 1) if snap else None,
+            "source": snap.source if snap else None,
+            "ttl": self.ttl,
+            "refreshing": self._refreshing,
+            "single_flight": self._flight.stats(),
+        }
+
+    def invalidate(self):
+        """Force the next get() to start a refresh."""
+        snap = self._snapshot
+        if snap is not None:
+            snap.fetched_at = 0
+
+def load_stored_leases_data():
+    """SnapshotCache fallback: (rows, saved_at) from the local store, or None if it is empty."""
+    try:
+        saved_at = get_store().saved_at()
+        if saved_at is None:
+            return None
+        return get_leases_data(from_store=True), saved_at
+    except SQLiteError as e:
+        print("Local store unreadable:", e)
+        return None
 
-    return data
\ No newline at end of file
+occupant_cache = SnapshotCache(get_map_leases_data, fallback=load_stored_leases_data)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+"""
+Local SQLite copy of the four Buildium resources behind get_leases_data.
+Written after every successful Buildium pull, read back when Buildium is
+slow or down (and later for history/querying).
+
+Tables:
+  leases     (id, property_id, unit_id, unit_number, data)
+  balances   (lease_id, total_balance)
+  units      (id, property_id, unit_number, data)
+  properties (id, name)
+  meta       (key, value)  -- saved_at etc.
+"""
+
+DB_PATH = os.getenv("OCCUPANT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "occupant_store.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY,
+    property_id INTEGER,
+    unit_id INTEGER,
+    unit_number TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leases_unit_id ON leases(unit_id);
+CREATE INDEX IF NOT EXISTS leases_property_id ON leases(property_id);
+
+CREATE TABLE IF NOT EXISTS balances (
+    lease_id INTEGER PRIMARY KEY,
+    total_balance REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    property_id INTEGER,
+    unit_number TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_property_number ON units(property_id, unit_number);
+
+CREATE TABLE IF NOT EXISTS properties (
+    id INTEGER PRIMARY KEY,
+    name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class OccupantStore:
+
+    def __init__(self, path=None):
+        self.path = path or DB_PATH
+        self._write_lock = threading.Lock()
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # Callers wrap it in closing(): the connection's own context manager
+        # only commits / rolls back, it never closes
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def save(self, leases, balances, units_map, prop_map, property_ids=None):
+        """
+        Replace the stored copy with one consistent Buildium pull.
+        property_ids => the pull only covered these properties, so only
+        their leases/balances/units are replaced.
+        """
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            if property_ids:
+                scope = ",".join("?" * len(property_ids))
+                conn.execute(f"DELETE FROM balances WHERE lease_id IN "
+                             f"(SELECT id FROM leases WHERE property_id IN ({scope}))", property_ids)
+                conn.execute(f"DELETE FROM leases WHERE property_id IN ({scope})", property_ids)
+                conn.execute(f"DELETE FROM units WHERE property_id IN ({scope})", property_ids)
+            else:
+                conn.execute("DELETE FROM leases")
+                conn.execute("DELETE FROM balances")
+                conn.execute("DELETE FROM units")
+            conn.execute("DELETE FROM properties")
+            conn.executemany(
+                "INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?, ?)",
+                [(l["Id"], l.get("PropertyId"), l.get("RentalUnitId"), l.get("UnitNumber"), json.dumps(l))
+                 for l in leases if "Id" in l])
+            conn.executemany(
+                "INSERT OR REPLACE INTO balances VALUES (?, ?)",
+                [(b["LeaseId"], b.get("TotalBalance", 0.0)) for b in balances if "LeaseId" in b])
+            conn.executemany(
+                "INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?)",
+                [(uid, u.get("PropertyId"), u.get("UnitNumber"), json.dumps(u)) for uid, u in units_map.items()])
+            conn.executemany(
+                "INSERT OR REPLACE INTO properties VALUES (?, ?)",
+                list(prop_map.items()))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('saved_at', ?)", (str(time.time()),))
+
+    def load(self, property_ids=None):
+        """
+        Same shape fetch_resources() returns: (leases, balances, units_map, prop_map).
+        Empty lists/dicts if nothing has been saved yet.
+        """
+        lease_where = unit_where = ""
+        args = ()
+        if property_ids:
+            scope = ",".join("?" * len(property_ids))
+            lease_where = f" WHERE property_id IN ({scope})"
+            unit_where = f" WHERE property_id IN ({scope})"
+            args = tuple(property_ids)
+        with closing(self._connect()) as conn, conn:
+            leases = [json.loads(row[0]) for row in
+                      conn.execute("SELECT data FROM leases" + lease_where + " ORDER BY id", args)]
+            balances = [{"LeaseId": lid, "TotalBalance": bal} for lid, bal in conn.execute(
+                "SELECT lease_id, total_balance FROM balances WHERE lease_id IN "
+                "(SELECT id FROM leases" + lease_where + ")", args)]
+            units_map = {uid: json.loads(data) for uid, data in
+                         conn.execute("SELECT id, data FROM units" + unit_where, args)}
+            prop_map = dict(conn.execute("SELECT id, name FROM properties"))
+        return leases, balances, units_map, prop_map
+
+    def saved_at(self):
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'saved_at'").fetchone()
+        return float(row[0]) if row else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OccupantStore()
+        return _store
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+
+"""
+Standalone snapshot refresher, for hosts where it can share a filesystem
+with the web workers:  python refresher.py
+It takes the refresher lock (waiting for it if a web worker holds it) and
+publishes snapshots for the workers to read; see snapshot_share.py.
+"""
+
+from occupant_service import occupant_cache
+from snapshot_share import SnapshotRefresher
+
+if __name__ == "__main__":
+    SnapshotRefresher(occupant_cache).run(blocking=True)
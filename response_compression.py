@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import gzip
+import os
+import threading
+from collections import OrderedDict
+
+import brotli
+
+"""
+gzip/brotli for the HTML shell and JSON responses.
+Bodies that carry an ETag (the shell, /api/booths) are the same bytes for
+every client until the snapshot changes, so their compressed form is kept
+in a small LRU keyed by (etag, encoding) and never compressed twice.
+"""
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESSIBLE_TYPES = {"text/html", "application/json"}
+# br first: noticeably smaller on the repetitive booth JSON
+ENCODINGS = ("br", "gzip")
+CACHE_SIZE = 32
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+class CompressedBodyCache:
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag, encoding, data):
+        key = (etag, encoding)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+        body = _compress(data, encoding)
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return body
+
+
+compressed_bodies = CompressedBodyCache()
+
+def choose_encoding(request):
+    accepted = request.accept_encodings
+    for encoding in ENCODINGS:
+        if accepted[encoding]:
+            return encoding
+    return None
+
+def finish_response(response, request):
+    """
+    after_request step: pick an encoding, give the compressed variant its own
+    ETag, answer If-None-Match with 304, and compress what is left.
+    """
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or response.mimetype not in COMPRESSIBLE_TYPES
+            or "Content-Encoding" in response.headers):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    etag, _ = response.get_etag()
+    data = response.get_data()
+    encoding = choose_encoding(request) if len(data) >= COMPRESS_MIN_SIZE else None
+    if etag and encoding:
+        # Same URL, different bytes => a different strong validator
+        response.set_etag(f"{etag}-{encoding}")
+    if etag:
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    if encoding:
+        if etag:
+            body = compressed_bodies.get(etag, encoding, data)
+        else:
+            body = _compress(data, encoding)
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    return response
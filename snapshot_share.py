@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX: no election, every process refreshes for itself
+    fcntl = None
+
+from buildium_api import BuildiumError
+from occupant_records import decode_rows, encode_rows
+from occupant_service import SNAPSHOT_TTL, Snapshot
+
+"""
+One refresher per machine, shared by every gunicorn worker.
+
+The worker that holds an flock on <SNAPSHOT_SHARE_PATH>.lock is the leader:
+it rebuilds the snapshot every REFRESH_INTERVAL seconds and publishes it to
+SNAPSHOT_SHARE_PATH with write-to-temp + os.replace, so readers only ever
+see a whole file. Every worker (leader included) serves from that file and
+re-reads it only when its mtime moves. If the leader dies its lock goes
+with it and another worker takes over, continuing the same version
+sequence.
+
+A refresh that outlives REFRESH_TIMEOUT makes the leader step down. If
+nothing is published for SNAPSHOT_STALE_SECONDS, readers serve the last
+file as source "stale" (under its own epoch, so open maps reload and show
+the notice) until publishing resumes.
+
+`python refresher.py` runs the same loop as its own process instead.
+"""
+
+SNAPSHOT_MODE = os.getenv("SNAPSHOT_MODE", "shared")  # "shared" or "local"
+SNAPSHOT_SHARE_PATH = os.getenv(
+    "SNAPSHOT_SHARE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "occupant_snapshot.json"))
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", str(SNAPSHOT_TTL)))
+LEADER_RETRY_SECONDS = 15
+# A leader whose refresh runs longer than this gives up the lock so another
+# worker can take over (the hung refresh is left to finish on its own)
+REFRESH_TIMEOUT = float(os.getenv("REFRESH_TIMEOUT", "300"))
+# Readers flag the data once nothing has been published for this long
+SNAPSHOT_STALE_SECONDS = float(os.getenv("SNAPSHOT_STALE_SECONDS", str(3 * REFRESH_INTERVAL)))
+# Cold boot with nothing published and no saved copy: how long a request
+# waits for the leader's first publish before answering 503
+FIRST_PUBLISH_WAIT_SECONDS = float(os.getenv("FIRST_PUBLISH_WAIT_SECONDS", "10"))
+FIRST_PUBLISH_POLL_SECONDS = 0.2
+
+
+class SnapshotNotReady(BuildiumError):
+    """Nothing published yet; the leader's first Buildium pull is still running."""
+
+
+def read_shared(path=None):
+    """Parsed snapshot file, or None if it is missing/unreadable."""
+    try:
+        with open(path or SNAPSHOT_SHARE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class SnapshotPublisher:
+    """
+    Numbers and writes snapshots to the shared file. The epoch is created
+    once with the file and version only moves when the snapshot's rows do,
+    so every reader sees one monotonically increasing sequence.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or SNAPSHOT_SHARE_PATH
+        existing = read_shared(self.path) or {}
+        self.epoch = existing.get("epoch") or os.urandom(4).hex()
+        self.version = existing.get("version", 0)
+        self.digest = existing.get("digest")
+        self.published = 0
+
+    def publish(self, snapshot):
+        if snapshot.digest != self.digest:
+            self.version += 1
+            self.digest = snapshot.digest
+        payload = {
+            "epoch": self.epoch,
+            "version": self.version,
+            "digest": self.digest,
+            "fetched_at": snapshot.fetched_at,
+            "published_at": time.time(),
+            "source": snapshot.source,
+            "rows": encode_rows(snapshot.rows),
+        }
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.published += 1
+
+
+class SharedSnapshotReader:
+    """Worker side: the latest published Snapshot, re-read only when the file changes."""
+
+    def __init__(self, path=None):
+        self.path = path or SNAPSHOT_SHARE_PATH
+        self._snapshot = None
+        self._mtime = None
+        self._published_at = None
+        self._stale = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def get(self):
+        """Latest published Snapshot, or a "stale" copy of it once publishing has stopped."""
+        snapshot = self._load()
+        if snapshot is None or time.time() - self._published_at < SNAPSHOT_STALE_SECONDS:
+            return snapshot
+        stale = self._stale
+        if stale is None or stale.digest != snapshot.digest or stale.version != snapshot.version:
+            stale = self._stale = Snapshot(snapshot.rows, snapshot.version, snapshot.fetched_at,
+                                           "stale", f"{snapshot.epoch}-stale", snapshot.digest)
+        return stale
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return self._snapshot
+        if mtime == self._mtime:
+            return self._snapshot
+        with self._lock:
+            if mtime != self._mtime:
+                data = read_shared(self.path)
+                if data is None:
+                    return self._snapshot
+                current = self._snapshot
+                if (current is not None and current.epoch == data["epoch"]
+                        and current.version == data["version"]):
+                    current.fetched_at = data["fetched_at"]  # republished, unchanged
+                else:
+                    self._snapshot = Snapshot(decode_rows(data["rows"]), data["version"], data["fetched_at"],
+                                              data["source"], data["epoch"], data["digest"])
+                    self.reloads += 1
+                self._published_at = data.get("published_at", data["fetched_at"])
+                self._mtime = mtime
+            return self._snapshot
+
+    def wait(self, timeout=None):
+        """get(), waiting up to timeout seconds for a first publish. Raises SnapshotNotReady."""
+        timeout = FIRST_PUBLISH_WAIT_SECONDS if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self.get()
+            if snapshot is not None:
+                return snapshot
+            if time.monotonic() >= deadline:
+                raise SnapshotNotReady(f"No snapshot published to {self.path} yet")
+            time.sleep(FIRST_PUBLISH_POLL_SECONDS)
+
+    def status(self):
+        snap = self.get()
+        return {
+            "version": snap.version if snap else None,
+            "epoch": snap.epoch if snap else None,
+            "age": round(snap.age, 1) if snap else None,
+            "published_age": round(time.time() - self._published_at, 1) if snap else None,
+            "source": snap.source if snap else None,
+            "reloads": self.reloads,
+        }
+
+
+class SnapshotRefresher:
+    """Leader-elected refresh loop; start() once per process."""
+
+    def __init__(self, cache, path=None, interval=None, timeout=None):
+        self.cache = cache
+        self.path = path or SNAPSHOT_SHARE_PATH
+        self.interval = REFRESH_INTERVAL if interval is None else interval
+        self.timeout = REFRESH_TIMEOUT if timeout is None else timeout
+        self.is_leader = False
+        self.step_downs = 0
+        self._stalled = None  # a refresh thread that outlived timeout
+        self.last_error = None
+        self._lock_file = None
+        self._publisher = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _try_lead(self, blocking=False):
+        if fcntl is None:
+            self.is_leader = True
+        else:
+            lock_file = open(f"{self.path}.lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file  # held (and so is the lock) until the process exits or steps down
+            self.is_leader = True
+        # Pick up the sequence where the previous leader left it
+        self._publisher = SnapshotPublisher(self.path)
+        print(f"Snapshot refresher: leader (pid {os.getpid()})")
+        return True
+
+    def _step_down(self):
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the flock
+            self._lock_file = None
+        self.is_leader = False
+        self._publisher = None
+        self.step_downs += 1
+
+    def refresh_once(self):
+        """
+        One refresh + publish, given at most self.timeout seconds. A refresh
+        still running after that is abandoned and this process steps down,
+        so a hung Buildium pull can't keep the lock (and stale data) forever.
+        """
+        result = {}
+
+        def build():
+            try:
+                result["snapshot"] = self.cache.refresh()
+            except Exception as e:
+                result["error"] = e
+
+        worker = threading.Thread(target=build, daemon=True)
+        worker.start()
+        worker.join(self.timeout)
+        if worker.is_alive():
+            self._stalled = worker
+            self.last_error = f"Refresh still running after {self.timeout:g}s; gave up leadership"
+            print(f"Snapshot refresher: {self.last_error} (pid {os.getpid()})")
+            self._step_down()
+            return
+        try:
+            if "error" in result:
+                raise result["error"]
+            self._publisher.publish(result["snapshot"])
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print("Snapshot refresh failed:", e)
+
+    def run(self, blocking=False):
+        while True:
+            if self._stalled is not None:
+                # Don't compete for the lock while our own abandoned refresh is still stuck
+                if self._stalled.is_alive():
+                    time.sleep(LEADER_RETRY_SECONDS)
+                    continue
+                self._stalled = None
+            if not self.is_leader:
+                self._try_lead(blocking)
+            if self.is_leader:
+                self.refresh_once()
+                time.sleep(self.interval)
+            else:
+                time.sleep(LEADER_RETRY_SECONDS)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, daemon=True)
+                self._thread.start()
+
+    def status(self):
+        return {
+            "mode": SNAPSHOT_MODE,
+            "leader": self.is_leader,
+            "pid": os.getpid(),
+            "published": self._publisher.published if self._publisher else 0,
+            "step_downs": self.step_downs,
+            "stalled": self._stalled is not None,
+            "last_error": self.last_error,
+        }
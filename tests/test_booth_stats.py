@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import random
+import unittest
+
+from booth_tokens import parse_token
+from booth_view import BoothView
+from map_layout import parse_layout
+from occupant_records import LeaseRecord
+from occupant_service import Snapshot
+
+"""
+BoothView's figures against a plain recount straight from the rows, over
+randomised snapshots. Run from the repo root: python -m unittest discover -s tests
+"""
+
+PROPERTY = "Visitors Flea Market"
+LABELS = [str(n) for n in range(1, 41)] + ["K1", "K2", "K3", "OF1", "OF2"]
+PRIORITY = ["S", "P", "K", "OF"]
+USE_BY_PREFIX = {"S": "Storage", "P": "Pantry", "K": "Kitchen", "OF": "Office"}
+
+
+def random_location(rng):
+    tokens = [rng.choice(["S", "P", ""]) + str(rng.randint(1, 45)) for _ in range(rng.randint(1, 2))]
+    return rng.choice([" ".join(tokens), "K%d" % rng.randint(1, 4), "OF%d" % rng.randint(1, 2), "N/A", ""])
+
+def random_rows(rng, count):
+    rows = []
+    for i in range(count):
+        name = "Company Storage" if rng.random() < 0.05 else "Tenant %d" % i
+        prop = PROPERTY if rng.random() < 0.9 else "Other"
+        balance = rng.choice([0.0, 0.0, -5.0, 12.34, 99.99])
+        rows.append(LeaseRecord(1000 + i, name, "2027-01-01", random_location(rng), balance, prop))
+    return rows
+
+def recount(rows, labels):
+    """The figures, computed the long way round."""
+    rows = [r for r in rows if r.property_name == PROPERTY]
+    parsed = {}
+    for r in rows:
+        loc = (r.location or "").strip()
+        tokens = loc.split() if loc and loc != "N/A" else []
+        parsed[r.lease_id] = [parse_token(t) for t in tokens]
+
+    def rank(r):
+        prefixes = [p for p, _ in parsed[r.lease_id] if p]
+        return min([PRIORITY.index(p) for p in prefixes] or [len(PRIORITY)])
+
+    def use(rank_):
+        return USE_BY_PREFIX[PRIORITY[rank_]] if rank_ < len(PRIORITY) else "Booth"
+
+    types = {"Kitchen": [0, 0], "Office": [0, 0], "Booth": [0, 0]}
+    uses = {c: [0, 0, 0, 0] for c in ["Storage", "Pantry", "Kitchen", "Office", "Booth"]}
+    for label in labels:
+        key = label.upper()
+        occupants = [r for r in rows for _, booth in parsed[r.lease_id] if booth.upper() == key]
+        kind = "Office" if key.startswith("OF") else "Kitchen" if key.startswith("K") else "Booth"
+        types[kind][0] += 1
+        if occupants:
+            types[kind][1] += 1
+            u = uses[use(min(rank(r) for r in occupants))]
+            u[0] += 1
+            u[1] += len(occupants)
+            u[2] += sum(1 for r in occupants if r.balance <= 0)
+    for r in rows:
+        if parsed[r.lease_id]:
+            uses[use(rank(r))][3] += max(round(r.balance * 100), 0)
+    return types, uses
+
+
+class BoothStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.layout = parse_layout({"booths": [
+            {"label": label, "x": i * 10, "y": 0, "width": 10, "height": 10}
+            for i, label in enumerate(LABELS)
+        ]}, mtime=1)
+
+    def build(self, rows, version):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return BoothView(Snapshot(rows, version), self.layout, PROPERTY)
+
+    def test_figures_match_recount(self):
+        rng = random.Random(7)
+        rows = random_rows(rng, 120)
+        for version in range(1, 41):
+            # Snapshot deltas: a few leases move, change balance or go away
+            rows = list(rows)
+            for _ in range(rng.randint(0, 6)):
+                j = rng.randrange(len(rows))
+                r = rows[j]
+                rows[j] = LeaseRecord(r.lease_id, r.occupant_name, r.lease_end_date,
+                                      random_location(rng), rng.choice([0.0, 12.34, 99.99]), r.property_name)
+            if rng.random() < 0.2:
+                rows.pop(rng.randrange(len(rows)))
+
+            figures = self.build(rows, version).figures
+            types, uses = recount(rows, LABELS)
+            booths = sum(t[0] for t in types.values())
+            occupied = sum(t[1] for t in types.values())
+            occupants = sum(u[1] for u in uses.values())
+            on_time = sum(u[2] for u in uses.values())
+            self.assertEqual(figures["occupancy_pct"], round(occupied / booths * 100, 1))
+            self.assertEqual(figures["rent_collection_pct"],
+                             round(on_time / occupants * 100, 1) if occupants else 0)
+            self.assertEqual(figures["outstanding"], sum(u[3] for u in uses.values()) / 100)
+            for use, u in uses.items():
+                got = figures["lease_uses"][use]
+                self.assertEqual((got["booths"], got["occupants"], got["on_time"], got["outstanding"]),
+                                 (u[0], u[1], u[2], u[3] / 100), use)
+            for kind, t in types.items():
+                got = figures["booth_types"][kind]
+                self.assertEqual((got["booths"], got["occupied"]), tuple(t), kind)
+
+    def test_booth_types_are_stable(self):
+        rng = random.Random(11)
+        seen = set()
+        for version in range(1, 21):
+            figures = self.build(random_rows(rng, 80), version).figures
+            seen.add(tuple(figures["booth_types"][kind]["booths"] for kind in ("Kitchen", "Office", "Booth")))
+            # Lease uses never report an occupancy that could only read 100%
+            self.assertEqual(set(figures["booth_types"]), {"Kitchen", "Office", "Booth"})
+            for use in figures["lease_uses"].values():
+                self.assertNotIn("occupancy_pct", use)
+        self.assertEqual(seen, {(3, 2, 40)})
+
+    def test_booth_type_and_lease_use_are_separate(self):
+        # K1 leased as "S24 K1": an occupied Kitchen booth, but a Storage lease (and colour)
+        rows = [LeaseRecord(1, "Tenant", "2027-01-01", "S24 K1", 0.0, PROPERTY)]
+        figures = self.build(rows, 1).figures
+        self.assertEqual(figures["booth_types"]["Kitchen"],
+                         {"booths": 3, "occupied": 1, "occupancy_pct": 33.3})
+        self.assertEqual(figures["lease_uses"]["Kitchen"]["booths"], 0)
+        self.assertEqual(figures["lease_uses"]["Storage"]["booths"], 2)  # booths 24 and K1
+        self.assertEqual(figures["booth_types"]["Booth"]["occupied"], 1)  # booth 24
+        self.assertNotIn("categories", figures)
+
+
+if __name__ == "__main__":
+    unittest.main()
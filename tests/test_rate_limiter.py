@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+
+from buildium_api import MIN_RATE, RateLimiter
+
+"""
+RateLimiter keeps letting requests through after its rate has been
+halved below one request per second by a run of 429s.
+"""
+
+ENDPOINT = "https://api.buildium.com/v1/leases"
+
+
+def acquires_within(limiter, seconds):
+    """True if acquire() returns within seconds (run in a thread so a hang can't stall the suite)."""
+    done = threading.Event()
+
+    def run():
+        limiter.acquire(ENDPOINT)
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return done.wait(seconds)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_acquire_returns_after_repeated_throttling(self):
+        limiter = RateLimiter(rate=10, max_concurrency=4)
+        # 10 => 5 => 2.5 => 1.25 => 0.625 => 0.5 requests/second
+        for _ in range(5):
+            self.assertTrue(acquires_within(limiter, 5))
+            limiter.release(ENDPOINT, throttled=True, retry_after=0)
+        self.assertEqual(limiter.metrics()[ENDPOINT]["rate_per_sec"], MIN_RATE)
+        # An empty bucket at 0.5/s refills one token in 2s
+        self.assertTrue(acquires_within(limiter, 4))
+        limiter.release(ENDPOINT)
+
+    def test_rate_below_one_per_second(self):
+        limiter = RateLimiter(rate=0.1, max_concurrency=1)
+        self.assertEqual(limiter.max_rate, MIN_RATE)
+        self.assertTrue(acquires_within(limiter, 1))
+        limiter.release(ENDPOINT)
+
+
+if __name__ == "__main__":
+    unittest.main()